@@ -1,14 +1,69 @@
 import asyncio
+import base64
+import binascii
+import functools
 import logging
+import os
 import random
 import re
+import signal
+import sys
+import time
+from collections import defaultdict
 from datetime import datetime
 from typing import Dict, List, Optional
+from urllib.parse import quote, unquote, urlsplit
 import pandas as pd
-from playwright.async_api import async_playwright, Page, Browser
+from playwright.async_api import async_playwright, Page, Browser, BrowserContext, Error as PlaywrightError
 import argparse
 import json
 
+try:
+    from datasketch import MinHash, MinHashLSH
+except ImportError:  # datasketch необязателен - без него используется индекс по токенам
+    MinHash = MinHashLSH = None
+
+try:
+    from rapidfuzz import fuzz, process as fuzz_process
+except ImportError:  # rapidfuzz необязателен - без него используется MinHash-LSH или индекс по токенам
+    fuzz = fuzz_process = None
+
+try:
+    import httpx
+except ImportError:  # httpx необязателен - нужен только для --api-key
+    httpx = None
+
+try:
+    import xlsxwriter
+except ImportError:  # xlsxwriter необязателен - без него Excel пишется через openpyxl
+    xlsxwriter = None
+
+try:
+    import orjson
+except ImportError:  # orjson необязателен - без него конфигурация читается стандартным json
+    orjson = None
+
+try:
+    from pybloom_live import ScalableBloomFilter
+except ImportError:  # pybloom_live необязателен - нужен только для --dedup-state
+    ScalableBloomFilter = None
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:  # pyarrow необязателен - нужен только для --parquet
+    pa = pq = None
+
+try:
+    import uvloop
+except ImportError:  # uvloop необязателен - без него используется стандартный цикл событий asyncio
+    uvloop = None
+
+try:
+    import pybase64
+except ImportError:  # pybase64 необязателен - без него ссылки 2ГИС декодируются стандартным base64
+    pybase64 = None
+
 # Настройка логирования
 logging.basicConfig(
     level=logging.INFO,
@@ -20,21 +75,563 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+# Предкомпилированные регулярные выражения для нормализации названий
+_WS_RE = re.compile(r'\s+')
+_PUNCT_RE = re.compile(r'[^\w\s]', re.UNICODE)
+_DIGITS_RE = re.compile(r'\d+')
+
+# Типичные суффиксы филиалов. Проходы выполняются по очереди, как и раньше: после удаления
+# суффикса следующий проход убирает оставшиеся в конце цифры ("пицца 3 филиал 2" -> "пицца")
+_SUFFIX_RES = tuple(re.compile(p, re.IGNORECASE) for p in (
+    r'\s*филиал\s*\d*',
+    r'\s*отделение\s*\d*',
+    r'\s*магазин\s*\d*',
+    r'\s*точка\s*\d*',
+    r'\s*№\s*\d+',
+    r'\s*\d+\s*$',  # Цифры в конце
+    r'\s*mall\s*',
+    r'\s*тц\s*',
+    r'\s*тдц\s*',
+    r'\s*центр\s*',
+    r'\s*фудкорт\s*',
+    r'\s*торговый\s*центр\s*',
+))
+
+# Сайт в декодированной ссылке 2ГИС: домен с необязательным протоколом (один проход).
+# Паттерны для декодированных ссылок байтовые - поиск идет прямо по результату base64
+_DECODED_URL_RE = re.compile(
+    rb'(?:https?://)?([a-zA-Z0-9][-a-zA-Z0-9]*\.(?:kz|com|ru|org|net|biz|cafe|coffee)(?:/[^\s]*)?)',
+    re.IGNORECASE
+)
+
+# Служебные домены, которые не считаются сайтом компании (одна проверка вместо any() по списку)
+_DECODED_BAD_DOMAIN_RE = re.compile(r'2gis|sberbank|yandex|google', re.IGNORECASE)
+_EXCLUDED_DOMAIN_RE = re.compile(r'2gis|google|yandex|facebook|vk', re.IGNORECASE)
+
+# Допустимые доменные зоны
+_VALID_TLDS = frozenset(('com', 'ru', 'kz', 'org', 'net', 'biz', 'info', 'cafe', 'coffee', 'shop', 'store'))
+
+# Домен (включая поддомены)
+_DOMAIN_RE = re.compile(r'^([a-zA-Z0-9]([a-zA-Z0-9\-]{0,61}[a-zA-Z0-9])?\.)+[a-zA-Z]{2,}$')
+
+
+# Атрибуты кнопок WhatsApp, в которых может быть номер или ссылка
+_WA_BUTTON_ATTRS = [
+    'href', 'data-url', 'data-link', 'data-phone',
+    'data-action', 'data-contact', 'onclick',
+    'data-whatsapp', 'data-phone-number'
+]
+# Проверка HTML страницы регуляркой без передачи самого HTML (флаг i - как re.IGNORECASE)
+_HTML_PROBE_JS = "(source) => new RegExp(source, 'i').test(document.documentElement.outerHTML)"
+# Кнопки WhatsApp: CSS-селекторы в порядке приоритета, затем теги с текстом "WhatsApp"
+# (аналог button:has-text("WhatsApp") и a:has-text("WhatsApp") из Playwright)
+_WA_BUTTON_SELECTORS = [
+    'button[title*="WhatsApp"], button[title*="whatsapp"]',
+    'a[title*="WhatsApp"], a[title*="whatsapp"]',
+    'div[title*="WhatsApp"], div[title*="whatsapp"]',
+    '[class*="whatsapp"]',
+    '[data-social="whatsapp"]'
+]
+_WA_BUTTON_TEXT_TAGS = ['button', 'a']
+# Атрибуты всех кнопок WhatsApp одним вызовом (по списку [имя, значение] на кнопку)
+_WA_BUTTONS_ATTRS_JS = """([selectors, textTags, names]) => {
+    const result = [];
+    const read = el => result.push(names.map(name => [name, el.getAttribute(name)]));
+    selectors.forEach(selector => document.querySelectorAll(selector).forEach(read));
+    textTags.forEach(tag => document.querySelectorAll(tag).forEach(el => {
+        if ((el.textContent || '').toLowerCase().includes('whatsapp')) read(el);
+    }));
+    return result;
+}"""
+
+# Паттерны номера WhatsApp в атрибутах кнопок
+_WA_LINK_RE = re.compile(r'(https://wa\.me/[^\s\'"]+)')
+_KZ_PHONE_RE = re.compile(r'(\+?7\d{10})')
+_WHATSAPP_WORD_RE = re.compile(r'whatsapp', re.IGNORECASE)
+# Теги HTML - текст страницы из уже полученного HTML без второго запроса в браузер
+_HTML_TAG_RE = re.compile(r'<[^>]+>')
+_PHONE_LIKE_RE = re.compile(r'\+?7?\d{10,11}')
+# Удаление "+", пробелов и дефисов из номера за один проход
+_PHONE_STRIP_TABLE = str.maketrans('', '', '+ -')
+
+# Ссылки 2ГИС в исходном коде страницы (в скриптах и JSON - ссылки из <a href> берутся из DOM)
+_GIS_LINK_RE = re.compile(r'(https://link\.2gis\.com/[^\s\'"]+)')
+
+# Instagram в onclick и в исходном коде страницы
+_INSTAGRAM_WORD_RE = re.compile(r'instagram', re.IGNORECASE)
+_INSTAGRAM_ONCLICK_RE = re.compile(r'(https://[^\'"\s]*instagram\.com[^\'"\s]*)')
+_INSTAGRAM_SOURCE_PATTERNS = (
+    r'instagram["\']?\s*:\s*["\']([^"\']+)["\']',
+    r'instagram\.com/([^"\')\s/]+)',
+    r'https://(?:www\.)?instagram\.com/([^"\')\s/]+)',
+    r'window\.open\(["\']([^"\']*instagram[^"\']*)["\']',
+    r'href\s*=\s*["\']([^"\']*instagram[^"\']*)["\']'
+)
+
+def _jaccard(a: frozenset, b: frozenset) -> float:
+    """Коэффициент Жаккара без построения объединения: |A ∪ B| = |A| + |B| - |A ∩ B|"""
+    common = len(a & b)
+    total = len(a) + len(b) - common
+    return common / total if total else 0.0
+
+def _normalize_wa_phone(phone: str) -> str:
+    """Номер для wa.me: без "+", пробелов и дефисов; 10-значный номер дополняется кодом страны 7"""
+    phone = phone.translate(_PHONE_STRIP_TABLE)
+    return '7' + phone if len(phone) == 10 else phone
+
+# SIMD-декодер pybase64 совместим по API (и по binascii.Error) со стандартным base64
+_urlsafe_b64decode = pybase64.urlsafe_b64decode if pybase64 else base64.urlsafe_b64decode
+
+@functools.lru_cache(maxsize=1024)
+def _decode_2gis_payload(link: str) -> Optional[bytes]:
+    """Декодирование base64-части ссылки link.2gis.com (после последнего /, без query и #)"""
+    encoded_part = urlsplit(link).path.rsplit('/', 1)[-1]
+    if not encoded_part:
+        return None
+    # Длина padding однозначно определяется длиной строки - одна попытка декодирования.
+    # Ошибку превращаем в None, чтобы lru_cache запомнил и битую ссылку (исключения не кэшируются)
+    try:
+        return _urlsafe_b64decode(encoded_part + '=' * (-len(encoded_part) % 4))
+    except binascii.Error as e:
+        logger.debug("Ошибка декодирования base64: %s", e)
+        return None
+
+@functools.lru_cache(maxsize=4096)
+def _website_from_2gis_link(link: str) -> Optional[str]:
+    """Сайт из ссылки link.2gis.com (результат кэшируется - у филиалов сети одна и та же ссылка)"""
+    decoded_bytes = _decode_2gis_payload(link)
+    if not decoded_bytes:
+        return None
+    logger.debug("Декодированная строка: %r...", decoded_bytes[:200])
+    
+    # Ищем URL в декодированной строке за один проход. Ссылки с протоколом
+    # приоритетнее "голых" доменов - первый подходящий домен запоминаем на случай,
+    # если ссылки с протоколом не найдется
+    bare_domain = None
+    for match in _DECODED_URL_RE.finditer(decoded_bytes):
+        domain = match.group(1).decode('utf-8', 'ignore')
+        
+        # Исключаем служебные домены
+        if _DECODED_BAD_DOMAIN_RE.search(domain):
+            continue
+        if len(domain) <= 6:
+            continue
+            
+        # Совпадение начинается раньше домена - значит, перед ним есть протокол
+        if match.start() != match.start(1):
+            return f"https://{domain}"
+        if bare_domain is None:
+            bare_domain = domain
+    
+    if bare_domain:
+        # Проверяем, есть ли уже протокол
+        return bare_domain if bare_domain.startswith('http') else f"https://{bare_domain}"
+    return None
+
+@functools.lru_cache(maxsize=4096)
+def _whatsapp_from_2gis_link(link: str) -> Optional[str]:
+    """WhatsApp из ссылки link.2gis.com (результат кэшируется - у филиалов сети одна и та же ссылка)"""
+    decoded_bytes = _decode_2gis_payload(link)
+    if not decoded_bytes:
+        return None
+        
+    # Ищем wa.me ссылку или номер в декодированной строке за один проход
+    match = _search_by_priority(_WA_DECODED_RE, decoded_bytes)
+    if not match:
+        return None
+    match = match.decode('ascii', 'ignore')
+    if match.startswith('https://'):
+        return unquote(match)
+    return f"https://wa.me/{match}"
+
+def _org_link_key(url: str) -> Optional[str]:
+    """Ключ организации по ссылке 2ГИС ("firm:<id>", "branch:<id>", "organization:<id>")"""
+    id_match = _ORG_LINK_ID_RE.search(url)
+    return f"{id_match.group(1)}:{id_match.group(2)}" if id_match else None
+
+@functools.lru_cache(maxsize=1024)
+def _is_blocked_host(host: Optional[str]) -> bool:
+    """Хост трекера или рекламной сети (результат кэшируется - хостов на странице немного)"""
+    return bool(host) and _BLOCKED_HOST_RE.search(host) is not None
+
+def _compile_alternation(patterns, flags=0):
+    """Объединение паттернов в одну альтернацию с именованными группами p0, p1, ...
+    
+    Альтернация обернута в lookahead, поэтому совпадения разных паттернов
+    могут перекрываться и ни одно не "съедается" соседним.
+    """
+    if isinstance(patterns[0], bytes):
+        alternation = b'|'.join(b'(?P<p%d>%s)' % (i, p) for i, p in enumerate(patterns))
+        return re.compile(b'(?=(?:%s))' % alternation, flags)
+    alternation = '|'.join(f'(?P<p{i}>{p})' for i, p in enumerate(patterns))
+    return re.compile(f'(?=(?:{alternation}))', flags)
+
+def _search_by_priority(combined: re.Pattern, text):
+    """Один проход по тексту: берется самое левое совпадение паттерна с наименьшим номером"""
+    best_index, best_text = None, None
+    for match in combined.finditer(text):
+        index = int(match.lastgroup[1:])
+        if best_index is None or index < best_index:
+            best_index, best_text = index, match.group(match.lastgroup)
+            if index == 0:
+                break
+    return best_text.strip() if best_text else None
+
+# WhatsApp в декодированной ссылке 2ГИС (в порядке приоритета, один проход по байтам)
+_WA_DECODED_RE = _compile_alternation((
+    rb'https://wa\.me/[^\s%"\']+',
+    rb'(?<=wa\.me/)\d+',
+    rb'(?<=whatsapp://send\?phone=)\d+'
+))
+
+# Instagram в исходном коде страницы (в порядке приоритета, один проход)
+_INSTAGRAM_SOURCE_RE = _compile_alternation(_INSTAGRAM_SOURCE_PATTERNS, re.IGNORECASE)
+
+# Номер WhatsApp в атрибутах кнопок (в порядке приоритета, один проход)
+_WA_ATTR_PHONE_RE = _compile_alternation((
+    r'\+?7\d{10}',
+    r'(?<=wa\.me/)\d+',
+    r'(?<=whatsapp://send\?phone=)\d+'
+))
+
+# Без одной из этих подстрок ни один паттерн WhatsApp в исходном коде не совпадет
+# ("phone" само по себе есть почти в любой карточке - паттерны требуют ключ "phone":)
+_WA_SOURCE_GATE_RE = re.compile(r'whatsapp|wa\.me|phone["\']:', re.IGNORECASE)
+
+# Без одной из этих подстрок в HTML шаг поиска WhatsApp в исходном коде ничего не найдет
+# (проверяется в браузере, чтобы не передавать HTML карточки в Python впустую)
+_WA_SOURCE_PROBE_RE = re.compile(r'link\.2gis\.com|' + _WA_SOURCE_GATE_RE.pattern, re.IGNORECASE)
+
+# WhatsApp в исходном коде страницы (в порядке приоритета, один проход).
+# В каждом паттерне ровно одна группа - она идет сразу за именованной группой pN
+_WA_SOURCE_RE = _compile_alternation((
+    r'whatsapp[^0-9]*(\+?7\d{10})',
+    r'wa\.me/(\d+)',
+    r'data-phone["\']:\s*["\'](\+?7\d{10})["\']',
+    r'phone["\']:\s*["\'](\+?7\d{10})["\']',
+    r'whatsapp["\']?\s*:\s*["\']([^"\']+)["\']'
+), re.IGNORECASE)
+
+# Паттерны для поиска адреса в тексте страницы (в порядке приоритета)
+_ADDRESS_RE = _compile_alternation((
+    r'ЖК\s+[А-Яа-я\s]+,\s*улица\s+[А-Яа-я\s]+,\s*\d+',
+    r'улица\s+[А-Яа-я\s]+,\s*\d+[А-Яа-я\s]*',
+    r'проспект\s+[А-Яа-я\s]+,\s*\d+[А-Яа-я\s]*',
+    r'бульвар\s+[А-Яа-я\s]+,\s*\d+[А-Яа-я\s]*',
+    # Совпадение может начинаться только в начале кириллического фрагмента: самое левое совпадение
+    # то же, но нет повторного перебора с каждой позиции внутри фрагмента (квадратичное время)
+    r'(?<![А-Яа-я\s])[А-Яа-я\s]+(?:район|микрорайон)[А-Яа-я\s\d,]*',
+    r'Астана[,\s]+[А-Яа-я\s\d,]+'
+))
+
+# Паттерны для поиска телефона в тексте страницы (в порядке приоритета)
+_PHONE_TEXT_RE = re.compile(r'[\d\-\+\(\)\s]{7,}')
+_PHONE_RE = _compile_alternation((
+    r'\+7\s*[-\(\s]*\d{3}\s*[-\)\s]*\d{3}[-\s]*\d{2}[-\s]*\d{2}',
+    r'8\s*[-\(\s]*\d{3}\s*[-\)\s]*\d{3}[-\s]*\d{2}[-\s]*\d{2}',
+    r'\+7\d{10}',
+    r'8\d{10}'
+))
+
+# Ответ API каталога 2ГИС с карточкой организации, который загружает сама страница
+_API_ITEM_URL_RE = re.compile(r'catalog\.api\.2gis\.\w+/[\d.]+/items/byid')
+_FIRM_ID_RE = re.compile(r'/firm/(\d+)')
+# id организации в ссылке из выдачи - ключ для дедупликации ссылок
+_ORG_LINK_ID_RE = re.compile(r'/(firm|branch|organization)/(\d+)')
+# Сколько секунд ждать ответ API или заголовок карточки после перехода на страницу
+_API_ITEM_TIMEOUT = 5
+# Сколько секунд еще ждать ответ API, если заголовок карточки уже появился
+_API_ITEM_GRACE = 0.5
+
+# Прямой запрос карточки организации в API каталога 2ГИС (режим --api-key)
+_CATALOG_API_URL = 'https://catalog.api.2gis.com/3.0/items/byid'
+_CATALOG_API_FIELDS = 'items.contact_groups,items.full_address_name'
+# Количество одновременных запросов к API каталога
+MAX_PARALLEL_API_REQUESTS = 16
+# Сколько секунд держать открытым неиспользуемое соединение с API каталога
+_API_KEEPALIVE_EXPIRY = 30
+
+# JS: абсолютные href всех ссылок по селектору за один вызов (без обхода элементов через CDP)
+_COLLECT_HREFS_JS = """(selector) => {
+    const hrefs = new Set();
+    document.querySelectorAll(selector).forEach(a => {
+        if (a.href) hrefs.add(a.href);
+    });
+    return [...hrefs];
+}"""
+# Прямые ссылки WhatsApp и ссылки 2ГИС в карточке - один составной селектор
+_WA_DIRECT_LINK_SELECTOR = 'a[href*="wa.me"], a[href*="whatsapp"], a[href*="link.2gis.com"]'
+# Ссылки на карточки организаций в выдаче - один составной селектор (DOM обходится один раз)
+_FIRM_LINK_SELECTOR = 'a[href*="/firm/"], a[href*="/organization/"], a[href*="/branch/"]'
+
+# Латинские названия городов в адресах 2ГИС (для прямого перехода на страницу выдачи)
+_CITY_SLUGS = {
+    'астана': 'astana',
+    'алматы': 'almaty',
+    'шымкент': 'shymkent',
+    'караганда': 'karaganda',
+    'актобе': 'aktobe',
+    'павлодар': 'pavlodar',
+    'усть-каменогорск': 'ustkamenogorsk',
+    'костанай': 'kostanay',
+    'атырау': 'atyrau',
+    'актау': 'aktau'
+}
+
+# Селекторы полей карточки организации (в порядке приоритета)
+_NAME_SELECTORS = ['h1', 'h2', '[class*="title"]', '[class*="name"]', '[class*="header"]']
+_ADDRESS_SELECTORS = ['[class*="address"]', '[class*="location"]', '.address', '.location']
+_PHONE_SELECTORS = ['a[href^="tel:"]', '[class*="phone"]', 'button[class*="phone"]']
+
+# Селекторы SVG и характерные фрагменты path иконки глобуса одной альтернацией (блок сайта в карточке)
+_GLOBE_SVG_SELECTORS = ['svg[fill="#028eff"]', 'svg', 'div._1iftozu svg']
+_GLOBE_PATH_PATTERN = r'M12 4a8 8|a8 8 0|A6 6 0'
+
+# JS: ссылки-кандидаты на сайт за один вызов - сначала из контейнеров _49kxlr рядом
+# с иконкой глобуса (до 5 уровней вверх), затем из всех _49kxlr на странице
+_WEBSITE_CANDIDATES_JS = """({svgSelectors, pathPattern}) => {
+    const globeRe = new RegExp(pathPattern);
+    const seen = new Set();
+    const candidates = [];
+    const collect = (root) => {
+        // Один составной селектор вместо обхода контейнеров и поиска ссылок в каждом
+        root.querySelectorAll('._49kxlr a').forEach(a => {
+            if (seen.has(a)) return;
+            seen.add(a);
+            candidates.push({href: a.getAttribute('href'), text: a.textContent});
+        });
+    };
+    const visitedSvgs = new Set();
+    for (const selector of svgSelectors) {
+        for (const svg of document.querySelectorAll(selector)) {
+            // Селекторы пересекаются - каждую иконку поднимаем по родителям один раз
+            if (visitedSvgs.has(svg)) continue;
+            visitedSvgs.add(svg);
+            const path = svg.querySelector('path');
+            const d = path ? path.getAttribute('d') : null;
+            if (!d || !globeRe.test(d)) continue;
+            let current = svg;
+            for (let level = 0; level < 5 && current.parentElement; level++) {
+                current = current.parentElement;
+                collect(current);
+            }
+        }
+    }
+    collect(document);
+    return candidates;
+}"""
+
+# JS: снимок всех нужных полей карточки за один вызов (вместо отдельных запросов на каждое поле),
+# включая ссылки-кандидаты на сайт
+_PAGE_SNAPSHOT_JS = """({nameSelectors, addressSelectors, phoneSelectors, svgSelectors, pathPattern}) => {
+    const websiteCandidates = """ + _WEBSITE_CANDIDATES_JS + """;
+    const firstText = (selectors) => {
+        for (const selector of selectors) {
+            const el = document.querySelector(selector);
+            const text = el && el.textContent ? el.textContent.trim() : '';
+            if (text) return text;
+        }
+        return null;
+    };
+    const firstHref = (selector) => {
+        const a = document.querySelector(selector);
+        return a ? a.getAttribute('href') : null;
+    };
+    const phones = [];
+    for (const selector of phoneSelectors) {
+        document.querySelectorAll(selector).forEach(el => {
+            phones.push({href: el.getAttribute('href'), text: el.textContent});
+        });
+    }
+    return {
+        text: document.body ? document.body.textContent : '',
+        name: firstText(nameSelectors),
+        address: firstText(addressSelectors),
+        phones: phones,
+        whatsapp: firstHref('a[href*="wa.me"]') || firstHref('a[href*="whatsapp"]'),
+        instagram: firstHref('a[href*="instagram"]'),
+        websiteCandidates: websiteCandidates({svgSelectors, pathPattern})
+    };
+}"""
+
+# JS: href первой ссылки на организацию в выдаче
+_FIRST_FIRM_HREF_JS = """() => {
+    const a = document.querySelector('a[href*="/firm/"]');
+    return a ? a.getAttribute('href') : null;
+}"""
+
+# JS: выдача обновилась - первая ссылка на организацию отличается от прежней
+_RESULTS_CHANGED_JS = """(previous) => {
+    const a = document.querySelector('a[href*="/firm/"]');
+    return a !== null && a.getAttribute('href') !== previous;
+}"""
+
+# Сколько ждать появления кнопки пагинации после прокрутки (мс) - иначе страница последняя
+_PAGINATION_TIMEOUT = 3000
+# Кнопка "Следующая": по тексту ссылки/кнопки (без учета регистра) и по атрибутам (в порядке приоритета)
+_NEXT_PAGE_TEXTS = ['>', 'следующая']
+_NEXT_PAGE_SELECTORS = ['[class*="next"]', '[aria-label*="Next"]', '[aria-label*="Следующая"]']
+
+# JS: элемент пагинации за один вызов - сначала видимая кнопка с номером страницы,
+# затем видимая и активная кнопка "Следующая"
+_FIND_PAGINATION_JS = """({pageNumber, nextTexts, nextSelectors}) => {
+    const usable = (el) => !el.disabled && el.getClientRects().length > 0;
+    const pageSelector = `a, button, [data-page="${pageNumber}"]`;
+    for (const el of document.querySelectorAll(pageSelector)) {
+        if ((el.textContent || '').trim() === pageNumber && usable(el)) return el;
+    }
+    const buttons = document.querySelectorAll('a, button');
+    for (const text of nextTexts) {
+        for (const el of buttons) {
+            if ((el.textContent || '').toLowerCase().includes(text) && usable(el)) return el;
+        }
+    }
+    for (const selector of nextSelectors) {
+        const el = document.querySelector(selector);
+        if (el && usable(el)) return el;
+    }
+    return null;
+}"""
+
+# JS: элементы с текстом "instagram" - onclick, data-атрибуты и href трех родителей за один вызов
+_INSTAGRAM_DATA_ATTRS = ['data-url', 'data-link', 'data-href', 'data-instagram', 'data-action']
+_INSTAGRAM_ELEMENTS_JS = """(dataAttrs) => {
+    const result = [];
+    document.querySelectorAll('button, div, span, a').forEach(el => {
+        if (!/instagram/i.test(el.textContent || '')) return;
+        const parentHrefs = [];
+        let parent = el;
+        for (let level = 0; level < 3 && parent.parentElement; level++) {
+            parent = parent.parentElement;
+            parentHrefs.push(parent.getAttribute('href'));
+        }
+        result.push({
+            onclick: el.getAttribute('onclick'),
+            data: dataAttrs.map(name => [name, el.getAttribute(name)]),
+            parentHrefs: parentHrefs
+        });
+    });
+    return result;
+}"""
+
+# Параметры запуска браузера и контекста
+_BROWSER_ARGS = [
+    '--disable-blink-features=AutomationControlled',
+    '--disable-web-security',
+    '--no-sandbox',
+    '--disable-dev-shm-usage',
+    '--disable-gpu',
+    '--disable-features=VizDisplayCompositor',
+    '--ignore-certificate-errors',
+    '--ignore-ssl-errors',
+    '--ignore-certificate-errors-spki-list'
+]
+_CONTEXT_OPTIONS = {
+    'viewport': {'width': 1920, 'height': 920},
+    'user_agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36',
+    'java_script_enabled': True,
+    'ignore_https_errors': True
+}
+
+# Типы ресурсов и адреса трекеров, которые не нужны для парсинга
+_BLOCKED_RESOURCE_TYPES = frozenset({'image', 'media', 'font', 'stylesheet', 'websocket', 'manifest', 'texttrack'})
+# Хосты аналитики и рекламы - проверяется только имя хоста, а не весь URL с параметрами
+_BLOCKED_HOST_RE = re.compile(
+    r'google-analytics|googletagmanager|doubleclick|yandex|mediator|mindbox|adfox|top-fwz1\.mail\.ru|mytarget'
+)
+
+# Колонки итоговой таблицы (порядок колонок в Excel)
+RESULT_COLUMNS = ['Название', 'Адрес', 'Телефон', 'Сайт', 'WhatsApp', 'Instagram', 'Категория', 'Есть сайт']
+# Сколько строк накапливается по колонкам перед записью пакета в Parquet
+_PARQUET_BATCH_SIZE = 1000
+
+# Количество страниц браузера, параллельно обрабатывающих организации (по умолчанию, см. --concurrency)
+MAX_PARALLEL_PAGES = 4
+# Количество категорий, обрабатываемых одновременно (по умолчанию, см. --category-concurrency)
+MAX_PARALLEL_CATEGORIES = 2
+
+# Адаптивная пауза между организациями: уменьшается после серии успешных загрузок,
+# удваивается после ошибки (в секундах)
+_DELAY_INITIAL = 2.0
+_DELAY_MIN = 0.3
+_DELAY_MAX = 15.0
+_DELAY_DECREASE = 0.7
+_DELAY_OK_STREAK = 3
+# Ответы, которыми сайт просит снизить частоту запросов, и пауза после них (в секундах)
+_THROTTLE_STATUSES = frozenset({429, 503})
+_THROTTLE_PAUSE = (2.0, 5.0)
+
+# Минимальная длина токена названия для индекса похожих компаний
+_MIN_TOKEN_LEN = 4
+# Порог схожести Жаккара по токенам названий
+_NAME_JACCARD_THRESHOLD = 0.6
+# Минимальная оценка rapidfuzz token_set_ratio для похожих названий
+_NAME_FUZZY_CUTOFF = 85
+# Параметры MinHash-LSH для поиска почти-дубликатов по символьным 3-граммам
+_MINHASH_NUM_PERM = 64
+_MINHASH_LSH_THRESHOLD = 0.8
+
 class GISParser:
-    def __init__(self, city: str = "Астана", max_items_per_category: int = 100):
+    def __init__(self, city: str = "Астана", max_items_per_category: int = 100,
+                 dedup_state_file: Optional[str] = None, api_key: Optional[str] = None,
+                 concurrency: int = MAX_PARALLEL_PAGES, user_data_dir: Optional[str] = None,
+                 category_concurrency: int = MAX_PARALLEL_CATEGORIES, parquet: bool = False,
+                 headless: bool = False, cdp_endpoint: Optional[str] = None):
         self.city = city
         self.max_items_per_category = max_items_per_category
-        self.results = []
+        self.concurrency = concurrency  # Сколько организаций обрабатывается одновременно
+        self.category_concurrency = category_concurrency  # Сколько категорий ищется одновременно
+        self.user_data_dir = user_data_dir  # Каталог постоянного профиля браузера (None - чистый профиль)
+        self.headless = headless  # Запуск браузера без окна
+        self.cdp_endpoint = cdp_endpoint  # Адрес уже запущенного браузера (вместо запуска нового)
+        self.dedup_state_file = dedup_state_file
+        self.api_key = api_key
+        self.http_client = None  # httpx.AsyncClient для режима --api-key
+        self.api_semaphore: Optional[asyncio.Semaphore] = None
+        # Результаты в памяти по колонкам - если Excel не пишется потоково
+        self.results: Dict[str, list] = {column: [] for column in RESULT_COLUMNS}
+        self.results_workbook = None  # xlsxwriter.Workbook при потоковой записи результатов
+        self.results_sheet = None
+        self.parquet = parquet  # Дополнительно писать результаты в Parquet (нужен pyarrow)
+        self.parquet_writer = None  # pyarrow.parquet.ParquetWriter при записи Parquet
+        self._parquet_columns: Dict[str, list] = {column: [] for column in RESULT_COLUMNS}  # Буфер пакета по колонкам
+        self._parquet_queue: Optional[asyncio.Queue] = None  # Готовые пакеты для фоновой записи
+        self._parquet_task: Optional[asyncio.Task] = None
+        # Счетчики для статистики - обновляются при добавлении результата (результаты только дописываются)
+        self._result_count = 0
+        self._duplicates_skipped = 0
+        self._categories_processed = 0
+        self._results_with_website = 0
+        self._results_with_whatsapp = 0
+        self._results_with_instagram = 0
         self.browser: Optional[Browser] = None
+        self.context: Optional[BrowserContext] = None
         self.page: Optional[Page] = None
+        self.page_pool: Optional[asyncio.Queue] = None
+        self.search_page_pool: Optional[asyncio.Queue] = None
+        self._page_html_cache: Dict[Page, str] = {}  # HTML текущей карточки на каждой странице пула
+        self._delay = _DELAY_INITIAL  # Текущая пауза между организациями (см. adaptive_delay)
+        self._ok_streak = 0
+        self._throttle_until = 0.0  # До этого момента (time.monotonic) новые запросы не отправляются
         self.playwright = None
         
         # Добавляем хранилище для отслеживания уникальных компаний
         self.processed_companies = set()  # Для быстрой проверки
-        self.company_details = {}  # Для хранения детальной информации
+        self.company_details = {}  # Адрес обработанной компании для сравнения похожих названий
+        self._raw_names_seen = set()  # Исходные названия в нижнем регистре - до нормализации
+        self.seen_filter = None  # Bloom-фильтр компаний из предыдущих запусков (--dedup-state)
+        self._seen_firm_ids = set()  # id карточек 2ГИС, успешно обработанных в этом запуске
+        self._token_index: Dict[str, set] = defaultdict(set)  # Токен -> названия с этим токеном
+        self._name_tokens: Dict[str, frozenset] = {}  # Название -> множество его токенов
+        self._name_lsh = (
+            MinHashLSH(threshold=_MINHASH_LSH_THRESHOLD, num_perm=_MINHASH_NUM_PERM)
+            if MinHashLSH and fuzz_process is None else None
+        )
         
-    def normalize_company_name(self, name: str) -> str:
-        """Нормализация названия компании для сравнения"""
+    @staticmethod
+    @functools.lru_cache(maxsize=8192)
+    def normalize_company_name(name: str) -> str:
+        """Нормализация названия компании для сравнения (результат кэшируется)"""
         if not name or name == 'Не указано':
             return ''
             
@@ -42,39 +639,40 @@ class GISParser:
         normalized = name.lower().strip()
         
         # Убираем лишние пробелы и символы
-        normalized = re.sub(r'\s+', ' ', normalized)
-        normalized = re.sub(r'[^\w\s]', '', normalized, flags=re.UNICODE)
-        
-        # Убираем типичные суффиксы филиалов
-        suffixes_to_remove = [
-            r'\s*филиал\s*\d*',
-            r'\s*отделение\s*\d*', 
-            r'\s*магазин\s*\d*',
-            r'\s*точка\s*\d*',
-            r'\s*№\s*\d+',
-            r'\s*\d+\s*$',  # Цифры в конце
-            r'\s*mall\s*',
-            r'\s*тц\s*',
-            r'\s*тдц\s*',
-            r'\s*центр\s*',
-            r'\s*фудкорт\s*',
-            r'\s*торговый\s*центр\s*',
-        ]
-        
-        for suffix in suffixes_to_remove:
-            normalized = re.sub(suffix, '', normalized, flags=re.IGNORECASE)
-        
-        # Убираем названия торговых центров в скобках или после запятой
-        normalized = re.sub(r'\([^)]*\)', '', normalized)  # Убираем все в скобках
-        normalized = re.sub(r',.*$', '', normalized)  # Убираем все после запятой
+        normalized = _WS_RE.sub(' ', normalized)
+        normalized = _PUNCT_RE.sub('', normalized)
+        # Скобок и запятых после этого в строке нет - отдельные проходы для
+        # "(...)" и ", ..." не нужны, результат от этого не меняется
+        
+        # Убираем типичные суффиксы филиалов (порядок проходов важен - не объединять в одну регулярку)
+        for suffix_re in _SUFFIX_RES:
+            normalized = suffix_re.sub('', normalized)
         
         # Финальная очистка
         normalized = normalized.strip()
         
         return normalized
     
+    def tokenize_company_name(self, normalized_name: str) -> frozenset:
+        """Разбиение нормализованного названия на значимые токены"""
+        return frozenset(t for t in normalized_name.split() if len(t) >= _MIN_TOKEN_LEN)
+    
+    def build_name_minhash(self, normalized_name: str):
+        """Построение MinHash по символьным 3-граммам нормализованного названия"""
+        minhash = MinHash(num_perm=_MINHASH_NUM_PERM)
+        if len(normalized_name) < 3:
+            minhash.update(normalized_name.encode('utf-8'))
+        for i in range(len(normalized_name) - 2):
+            minhash.update(normalized_name[i:i + 3].encode('utf-8'))
+        return minhash
+    
     def is_company_already_processed(self, name: str, address: str = None) -> bool:
         """Проверка, была ли компания уже обработана"""
+        # Быстрая проверка точного совпадения - без нормализации
+        if name and name.strip().lower() in self._raw_names_seen:
+            logger.info("🔄 Компания '%s' уже обработана (дубликат)", name)
+            return True
+            
         normalized_name = self.normalize_company_name(name)
         
         if not normalized_name:
@@ -82,109 +680,307 @@ class GISParser:
             
         # Простая проверка по названию
         if normalized_name in self.processed_companies:
-            logger.info(f"🔄 Компания '{name}' уже обработана (дубликат)")
+            logger.info("🔄 Компания '%s' уже обработана (дубликат)", name)
             return True
             
-        # Дополнительная проверка по похожим названиям
-        for existing_name in self.processed_companies:
-            # Проверяем схожесть названий (например, если одно содержится в другом)
-            if len(normalized_name) > 3 and len(existing_name) > 3:
-                if normalized_name in existing_name or existing_name in normalized_name:
-                    # Дополнительно проверяем адрес если есть
-                    if address and existing_name in self.company_details:
-                        existing_address = self.company_details[existing_name].get('address', '')
-                        if existing_address and address:
-                            # Если адреса разные, возможно это разные компании
-                            if not self.addresses_similar(address, existing_address):
-                                continue
-                    
-                    logger.info(f"🔄 Найдена похожая компания: '{name}' ≈ '{existing_name}' (пропускаем)")
-                    return True
+        # Проверка по компаниям из предыдущих запусков
+        if self.seen_filter is not None and normalized_name in self.seen_filter:
+            logger.info("🔄 Компания '%s' уже обработана в предыдущем запуске", name)
+            return True
+            
+        address_tokens = None
+        for existing_name in self.find_similar_companies(normalized_name):
+            # Дополнительно проверяем адрес если есть
+            if address and existing_name in self.company_details:
+                existing = self.company_details[existing_name]
+                if existing['address']:
+                    # Токены входящего адреса считаем один раз на все кандидаты
+                    if address_tokens is None:
+                        address_tokens = self.address_tokens(address)
+                    # Если адреса разные, возможно это разные компании
+                    if not self.addresses_similar(address, existing['address'],
+                                                  address_tokens, existing['address_tokens']):
+                        continue
+            
+            logger.info("🔄 Найдена похожая компания: '%s' ≈ '%s' (пропускаем)", name, existing_name)
+            return True
         
         return False
     
-    def addresses_similar(self, addr1: str, addr2: str) -> bool:
-        """Проверка схожести адресов"""
+    def find_similar_companies(self, normalized_name: str) -> List[str]:
+        """Поиск уже обработанных компаний с похожим названием"""
+        # rapidfuzz сравнивает со всеми названиями в C++ и учитывает перестановку слов
+        if fuzz_process is not None:
+            matches = fuzz_process.extract(
+                normalized_name, self.processed_companies, scorer=fuzz.token_set_ratio,
+                score_cutoff=_NAME_FUZZY_CUTOFF, limit=None
+            )
+            return [existing_name for existing_name, _, _ in matches]
+            
+        # MinHash-LSH находит почти-дубликаты (опечатки, перестановки) за O(1)
+        if self._name_lsh is not None:
+            return self._name_lsh.query(self.build_name_minhash(normalized_name))
+            
+        # Без datasketch - сравниваем только с кандидатами, у которых есть общие токены
+        tokens = self.tokenize_company_name(normalized_name)
+        if not tokens:
+            return []
+            
+        candidates = set()
+        for token in tokens:
+            candidates.update(self._token_index.get(token, ()))
+        
+        similar = []
+        for existing_name in candidates:
+            existing_tokens = self._name_tokens[existing_name]
+            # Одно название содержит все токены другого или токены совпадают достаточно сильно
+            if (tokens <= existing_tokens or existing_tokens <= tokens or
+                    _jaccard(tokens, existing_tokens) >= _NAME_JACCARD_THRESHOLD):
+                similar.append(existing_name)
+        return similar
+    
+    def address_tokens(self, address: str) -> frozenset:
+        """Слова адреса без знаков препинания и номеров домов/квартир"""
+        normalized = _PUNCT_RE.sub(' ', address.lower())
+        return frozenset(_DIGITS_RE.sub('', normalized).split())
+    
+    def addresses_similar(self, addr1: str, addr2: str,
+                          addr1_tokens: Optional[frozenset] = None,
+                          addr2_tokens: Optional[frozenset] = None) -> bool:
+        """Проверка схожести адресов (токены можно передать заранее посчитанными)"""
         if not addr1 or not addr2:
             return False
             
-        # Нормализуем адреса
-        addr1_norm = re.sub(r'[^\w\s]', ' ', addr1.lower())
-        addr2_norm = re.sub(r'[^\w\s]', ' ', addr2.lower())
+        if addr1_tokens is None:
+            addr1_tokens = self.address_tokens(addr1)
+        if addr2_tokens is None:
+            addr2_tokens = self.address_tokens(addr2)
         
-        # Убираем номера домов/квартир для сравнения района
-        addr1_base = re.sub(r'\d+', '', addr1_norm).strip()
-        addr2_base = re.sub(r'\d+', '', addr2_norm).strip()
-        
-        # Если базовые части адресов совпадают более чем на 70%
-        common_words = set(addr1_base.split()) & set(addr2_base.split())
-        total_words = set(addr1_base.split()) | set(addr2_base.split())
-        
-        if total_words and len(common_words) / len(total_words) > 0.7:
-            return True
+        # Дешевый фильтр по размерам множеств: коэффициент Жаккара не больше min/max,
+        # поэтому такие пары заведомо не пройдут порог 0.7
+        size1, size2 = len(addr1_tokens), len(addr2_tokens)
+        if min(size1, size2) <= 0.7 * max(size1, size2):
+            return False
             
-        return False
+        # Если базовые части адресов совпадают более чем на 70%
+        return _jaccard(addr1_tokens, addr2_tokens) > 0.7
     
     def add_company_to_processed(self, name: str, business_info: Dict):
         """Добавление компании в список обработанных"""
         normalized_name = self.normalize_company_name(name)
         if normalized_name:
+            self._raw_names_seen.add(name.strip().lower())
             self.processed_companies.add(normalized_name)
+            if self.seen_filter is not None:
+                self.seen_filter.add(normalized_name)
+            tokens = self.tokenize_company_name(normalized_name)
+            self._name_tokens[normalized_name] = tokens
+            for token in tokens:
+                self._token_index[token].add(normalized_name)
+            if self._name_lsh is not None and normalized_name not in self._name_lsh:
+                self._name_lsh.insert(normalized_name, self.build_name_minhash(normalized_name))
+            address = business_info.get('Адрес', '')
+            # Для сравнения нужен только адрес - остальные поля компании уже есть в результатах
             self.company_details[normalized_name] = {
-                'original_name': name,
-                'address': business_info.get('Адрес', ''),
-                'category': business_info.get('Категория', ''),
-                'phone': business_info.get('Телефон', ''),
-                'website': business_info.get('Сайт', '')
+                'address': address,
+                'address_tokens': self.address_tokens(address) if address else frozenset()
             }
-            logger.debug(f"✅ Добавлена в обработанные: '{normalized_name}'")
+            logger.debug("✅ Добавлена в обработанные: '%s'", normalized_name)
+        
+    def is_firm_already_seen(self, url: str) -> bool:
+        """Проверка id карточки 2ГИС до загрузки страницы (id запоминает remember_firm)"""
+        firm_key = _org_link_key(url)
+        if not firm_key:
+            return False
+        return firm_key in self._seen_firm_ids or (self.seen_filter is not None and firm_key in self.seen_filter)
+        
+    def remember_firm(self, url: str):
+        """Сохранение id успешно обработанной карточки - в этом запуске и в состоянии между запусками.
+        
+        Вызывается только после получения результата: карточка, которая не загрузилась или
+        не уложилась в лимит категории, в других категориях обрабатывается заново.
+        """
+        firm_key = _org_link_key(url)
+        if not firm_key:
+            return
+        self._seen_firm_ids.add(firm_key)
+        if self.seen_filter is not None:
+            self.seen_filter.add(firm_key)
+
+    def load_dedup_state(self):
+        """Загрузка Bloom-фильтра обработанных компаний из файла состояния"""
+        if not self.dedup_state_file:
+            return
+        if ScalableBloomFilter is None:
+            logger.warning("⚠️ Для --dedup-state нужен пакет pybloom_live - состояние не используется")
+            self.dedup_state_file = None
+            return
+            
+        try:
+            with open(self.dedup_state_file, 'rb') as f:
+                self.seen_filter = ScalableBloomFilter.fromfile(f)
+            logger.info("📂 Загружено состояние дедупликации: %s (%s записей)", self.dedup_state_file, len(self.seen_filter))
+        except FileNotFoundError:
+            self.seen_filter = ScalableBloomFilter(initial_capacity=10000, error_rate=0.001)
+            logger.info("📂 Файл состояния %s не найден - будет создан", self.dedup_state_file)
+    
+    def save_dedup_state(self):
+        """Сохранение Bloom-фильтра обработанных компаний в файл состояния"""
+        if not self.dedup_state_file or self.seen_filter is None:
+            return
+            
+        try:
+            with open(self.dedup_state_file, 'wb') as f:
+                self.seen_filter.tofile(f)
+            logger.info("💾 Состояние дедупликации сохранено: %s", self.dedup_state_file)
+        except Exception as e:
+            logger.error("Ошибка при сохранении состояния дедупликации: %s", e)
         
     async def setup_browser(self):
         """Настройка и запуск браузера"""
         self.playwright = await async_playwright().start()
         
-        self.browser = await self.playwright.chromium.launch(
-            headless=False,
-            args=[
-                '--disable-blink-features=AutomationControlled',
-                '--disable-web-security',
-                '--no-sandbox',
-                '--disable-dev-shm-usage',
-                '--disable-gpu',
-                '--disable-features=VizDisplayCompositor',
-                '--ignore-certificate-errors',
-                '--ignore-ssl-errors',
-                '--ignore-certificate-errors-spki-list'
-            ]
-        )
+        if self.cdp_endpoint:
+            # Подключение к уже запущенному браузеру - без холодного старта Chromium.
+            # Парсер работает в собственном контексте, вкладки браузера не затрагиваются
+            self.browser = await self.playwright.chromium.connect_over_cdp(self.cdp_endpoint)
+            self.context = await self.browser.new_context(**_CONTEXT_OPTIONS)
+            logger.info("🔌 Подключение к запущенному браузеру: %s", self.cdp_endpoint)
+        elif self.user_data_dir:
+            # Постоянный профиль: cookies, localStorage и кэш сохраняются между категориями и запусками
+            self.context = await self.playwright.chromium.launch_persistent_context(
+                self.user_data_dir,
+                headless=self.headless,
+                args=_BROWSER_ARGS,
+                **_CONTEXT_OPTIONS
+            )
+            logger.info("📁 Используется профиль браузера: %s", self.user_data_dir)
+        else:
+            self.browser = await self.playwright.chromium.launch(
+                headless=self.headless,
+                args=_BROWSER_ARGS
+            )
+            self.context = await self.browser.new_context(**_CONTEXT_OPTIONS)
         
-        context = await self.browser.new_context(
-            viewport={'width': 1920, 'height': 920},
-            user_agent='Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36',
-            java_script_enabled=True,
-            ignore_https_errors=True
-        )
+        # Увеличиваем таймауты (для всех страниц контекста)
+        self.context.set_default_timeout(30000)
+        self.context.set_default_navigation_timeout(30000)
+        
+        # Блокируем тяжелые ресурсы и трекеры
+        await self.context.route("**/*", self.block_unneeded_resources)
+        # Следим за ответами 429/503 - паузы делаются только когда сайт их требует
+        self.context.on('response', self.on_context_response)
         
-        self.page = await context.new_page()
+        # Основная страница - для поиска и пагинации (постоянный контекст открывается с пустой вкладкой)
+        self.page = self.context.pages[0] if self.context.pages else await self.context.new_page()
+        
+        # Остальные страницы открываются одновременно, а не по одной
+        pages = await asyncio.gather(
+            *(self.context.new_page() for _ in range(self.category_concurrency - 1 + self.concurrency))
+        )
         
-        # Увеличиваем таймауты
-        self.page.set_default_timeout(30000)
-        self.page.set_default_navigation_timeout(30000)
+        # Страницы поиска - по одной на каждую параллельно обрабатываемую категорию
+        self.search_page_pool = asyncio.Queue()
+        self.search_page_pool.put_nowait(self.page)
+        for page in pages[:self.category_concurrency - 1]:
+            self.search_page_pool.put_nowait(page)
         
-        # Блокируем только тяжелые ресурсы
-        await self.page.route("**/*.{png,jpg,jpeg,gif,webp,svg,mp4,avi,mov}", lambda route: route.abort())
+        # Пул страниц для параллельной обработки организаций
+        self.page_pool = asyncio.Queue()
+        for page in pages[self.category_concurrency - 1:]:
+            self.page_pool.put_nowait(page)
         
         logger.info("Браузер успешно запущен")
         
+    async def release_page(self, page: Page):
+        """Возврат страницы в пул; закрытая (упавшая) страница заменяется новой"""
+        if page.is_closed():
+            logger.warning("⚠️ Страница из пула закрыта - создаем новую")
+            try:
+                page = await self.context.new_page()
+            except Exception as e:
+                logger.error("❌ Не удалось создать страницу взамен закрытой: %s", e)
+                return
+        self.page_pool.put_nowait(page)
+        
+    async def block_unneeded_resources(self, route):
+        """Отмена запросов к тяжелым ресурсам и трекерам, остальные пропускаются"""
+        request = route.request
+        if request.resource_type in _BLOCKED_RESOURCE_TYPES or _is_blocked_host(urlsplit(request.url).hostname):
+            await route.abort()
+        else:
+            await route.continue_()
+        
     async def random_delay(self, min_sec: float = 1.0, max_sec: float = 3.0):
         """Случайная задержка"""
         delay = random.uniform(min_sec, max_sec)
-        logger.debug(f"Задержка {delay:.1f} секунд")
+        logger.debug("Задержка %.1f секунд", delay)
+        await asyncio.sleep(delay)
+        
+    async def adaptive_delay(self):
+        """Пауза между организациями, подстраиваемая под отклик сайта"""
+        delay = self._delay + random.random() * 0.5
+        logger.debug("Задержка %.1f секунд", delay)
         await asyncio.sleep(delay)
         
-    async def open_2gis_and_search(self, category: str):
+    def on_context_response(self, response):
+        """Сайт ограничивает частоту запросов - откладываем следующие запросы"""
+        if response.status not in _THROTTLE_STATUSES:
+            return
+        resource_type = response.request.resource_type
+        if resource_type not in ('document', 'xhr', 'fetch'):
+            return
+        self._throttle_until = max(self._throttle_until, time.monotonic() + random.uniform(*_THROTTLE_PAUSE))
+        logger.warning("⚠️ Сайт ответил %s - запросы приостановлены", response.status)
+        if resource_type == 'document':
+            self.note_page_fail()
+            
+    async def throttle_pause(self):
+        """Пауза только после сигнала ограничения частоты от сайта (см. on_context_response)"""
+        remaining = self._throttle_until - time.monotonic()
+        if remaining > 0:
+            logger.debug("Пауза по ограничению частоты: %.1f секунд", remaining)
+            await asyncio.sleep(remaining)
+        
+    def note_page_ok(self):
+        """Успешная загрузка: после серии успехов пауза уменьшается"""
+        self._ok_streak += 1
+        if self._ok_streak >= _DELAY_OK_STREAK:
+            self._delay = max(_DELAY_MIN, self._delay * _DELAY_DECREASE)
+            self._ok_streak = 0
+            
+    def note_page_fail(self):
+        """Ошибка загрузки: пауза удваивается"""
+        self._ok_streak = 0
+        self._delay = min(_DELAY_MAX, self._delay * 2)
+        logger.debug("Пауза между организациями увеличена до %.1f секунд", self._delay)
+        
+    async def search_by_url(self, category: str, page: Page) -> bool:
+        """Переход сразу на страницу выдачи 2ГИС по адресу - без главной страницы и ввода запроса"""
+        city = self.city.lower()
+        slug = _CITY_SLUGS.get(city, city if city.isascii() else None)
+        if not slug:
+            return False
+            
+        url = f"https://2gis.kz/{quote(slug)}/search/{quote(category)}"
+        try:
+            logger.info("Открываем выдачу: %s", url)
+            await self.throttle_pause()
+            await page.goto(url, wait_until="commit", timeout=20000)
+            await page.wait_for_selector(_FIRM_LINK_SELECTOR, state='attached', timeout=15000)
+        except PlaywrightError as e:
+            logger.warning("Выдача по адресу %s не загрузилась: %s", url, e)
+            return False
+        logger.info("Поиск выполнен успешно: %s", category)
+        return True
+        
+    async def open_2gis_and_search(self, category: str, page: Page):
         """Открытие 2ГИС и выполнение поиска"""
         try:
+            # Сначала открываем выдачу напрямую по адресу, поиск через поле ввода - запасной вариант
+            if await self.search_by_url(category, page):
+                return True
+                
             # Пробуем разные варианты URL
             urls_to_try = [
                 f"https://2gis.kz/{self.city.lower()}",
@@ -195,14 +991,14 @@ class GISParser:
             page_loaded = False
             for url in urls_to_try:
                 try:
-                    logger.info(f"Пробуем загрузить: {url}")
-                    await self.page.goto(url, wait_until="domcontentloaded", timeout=20000)
-                    await self.random_delay(2, 4)
+                    logger.info("Пробуем загрузить: %s", url)
+                    await self.throttle_pause()
+                    await page.goto(url, wait_until="domcontentloaded", timeout=20000)
                     page_loaded = True
-                    logger.info(f"Успешно загружена страница: {url}")
+                    logger.info("Успешно загружена страница: %s", url)
                     break
                 except Exception as e:
-                    logger.warning(f"Не удалось загрузить {url}: {e}")
+                    logger.warning("Не удалось загрузить %s: %s", url, e)
                     continue
             
             if not page_loaded:
@@ -222,11 +1018,11 @@ class GISParser:
             search_input = None
             for selector in search_selectors:
                 try:
-                    search_input = await self.page.wait_for_selector(selector, timeout=5000)
+                    search_input = await page.wait_for_selector(selector, timeout=5000)
                     if search_input:
-                        logger.info(f"Найдено поле поиска: {selector}")
+                        logger.info("Найдено поле поиска: %s", selector)
                         break
-                except:
+                except PlaywrightError:
                     continue
             
             if not search_input:
@@ -235,61 +1031,58 @@ class GISParser:
             
             # Вводим поисковый запрос
             await search_input.fill('')
-            await self.random_delay(0.5, 1)
             await search_input.type(category, delay=100)
-            await self.random_delay(1, 2)
+            await self.random_delay(0.5, 1)
             
-            # Нажимаем Enter
-            await self.page.keyboard.press('Enter')
-            await self.random_delay(5, 7)
+            # Нажимаем Enter и ждем появления выдачи вместо фиксированной паузы
+            await page.keyboard.press('Enter')
+            try:
+                await page.wait_for_selector(_FIRM_LINK_SELECTOR, state='attached', timeout=15000)
+            except PlaywrightError:
+                logger.warning("Выдача не появилась за 15 секунд")
             
             # Проверяем, что поиск выполнился
-            current_url = self.page.url
+            current_url = page.url
             if category.lower() in current_url.lower() or 'search' in current_url.lower():
-                logger.info(f"Поиск выполнен успешно: {category}")
-                return True
+                logger.info("Поиск выполнен успешно: %s", category)
             else:
-                logger.warning(f"Поиск может быть не выполнен. Текущий URL: {current_url}")
-                # Даем еще одну попытку
-                await self.random_delay(3, 5)
-                return True
+                logger.warning("Поиск может быть не выполнен. Текущий URL: %s", current_url)
+            return True
             
         except Exception as e:
-            logger.error(f"Ошибка при поиске: {e}")
+            logger.error("Ошибка при поиске: %s", e)
             return False
             
-    async def get_business_links_pagination_fixed(self):
+    async def get_business_links_pagination_fixed(self, page: Page):
         """ИСПРАВЛЕННАЯ пагинация - обрабатывает ВСЕ страницы"""
         try:
-            await self.random_delay(3, 5)
-            
             logger.info("🔍 Запуск ИСПРАВЛЕННОЙ пагинации...")
             
-            all_unique_links = set()
+            all_unique_links: Dict[str, str] = {}  # id организации -> ссылка
             current_page = 1
             max_pages = 50  # Увеличиваем лимит
             consecutive_failures = 0
             max_failures = 3  # Если 3 раза подряд не можем перейти - останавливаемся
             
             while current_page <= max_pages and consecutive_failures < max_failures:
-                logger.info(f"📄 Обрабатываем страницу {current_page}")
+                logger.info("📄 Обрабатываем страницу %s", current_page)
                 
                 # Скроллим вверх перед сбором ссылок
-                await self.page.evaluate("window.scrollTo(0, 0)")
-                await self.random_delay(2, 3)
+                await page.evaluate("window.scrollTo(0, 0)")
                 
                 # Собираем ссылки с текущей страницы
-                current_links = await self.collect_links_from_current_page()
+                current_links = await self.collect_links_from_current_page(page)
                 old_count = len(all_unique_links)
-                all_unique_links.update(current_links)
+                for key, link in current_links.items():
+                    all_unique_links.setdefault(key, link)
                 new_count = len(all_unique_links)
                 new_links = new_count - old_count
                 
-                logger.info(f"📊 Страница {current_page}: добавлено {new_links} новых ссылок (всего: {new_count})")
+                logger.info("📊 Страница %s: добавлено %s новых ссылок (всего: %s)", current_page, new_links, new_count)
                 
                 # Проверяем лимит
                 if new_count >= self.max_items_per_category:
-                    logger.info(f"🎯 Достигнут лимит {self.max_items_per_category} ссылок!")
+                    logger.info("🎯 Достигнут лимит %s ссылок!", self.max_items_per_category)
                     break
                 
                 # Если нет новых ссылок, но это не первая страница - возможно конец
@@ -298,1126 +1091,1199 @@ class GISParser:
                     break
                 
                 # Переходим на следующую страницу
-                next_page_found = await self.go_to_next_page_fixed(current_page + 1)
+                next_page_found = await self.go_to_next_page_fixed(page, current_page + 1)
                 
-                if next_page_found:
+                if next_page_found is None:
+                    # Кнопки следующей страницы нет - повторные попытки ничего не дадут
+                    logger.info("🏁 Больше нет доступных страниц")
+                    break
+                elif next_page_found:
                     consecutive_failures = 0  # Сбрасываем счетчик неудач
                     current_page += 1
                 else:
                     consecutive_failures += 1
-                    logger.info(f"⚠️ Не удалось перейти на страницу {current_page + 1} (попытка {consecutive_failures}/{max_failures})")
+                    logger.info("⚠️ Не удалось перейти на страницу %s (попытка %s/%s)", current_page + 1, consecutive_failures, max_failures)
                     
                     if consecutive_failures >= max_failures:
                         logger.info("🏁 Больше нет доступных страниц")
                         break
             
-            business_urls = list(all_unique_links)[:self.max_items_per_category]
-            logger.info(f"🎉 ИТОГО собрано {len(business_urls)} ссылок с {current_page} страниц!")
+            business_urls = list(all_unique_links.values())[:self.max_items_per_category]
+            logger.info("🎉 ИТОГО собрано %s ссылок с %s страниц!", len(business_urls), current_page)
             
             return business_urls
             
         except Exception as e:
-            logger.error(f"💥 Ошибка в исправленной пагинации: {e}")
+            logger.error("💥 Ошибка в исправленной пагинации: %s", e)
             return []
 
-    async def collect_links_from_current_page(self):
-        """Собираем все ссылки с текущей страницы"""
-        links = set()
+    async def collect_links_from_current_page(self, page: Page) -> Dict[str, str]:
+        """Собираем все ссылки с текущей страницы (id организации -> ссылка без query и #)"""
+        links = {}
         
-        # Ждем загрузки контента
-        await self.random_delay(2, 4)
+        # Ждем появления ссылок на организации
+        try:
+            await page.wait_for_selector(_FIRM_LINK_SELECTOR, state='attached', timeout=10000)
+        except PlaywrightError:
+            return links
         
-        link_selectors = [
-            'a[href*="/firm/"]',
-            'a[href*="/organization/"]',
-            'a[href*="/branch/"]',
-            'a[href*="astana/firm"]',
-            'a[href*="astana/organization"]',
-            'a[href*="astana/branch"]'
-        ]
+        try:
+            # Селектор уже отбирает только ссылки на организации, а a.href в браузере абсолютный
+            hrefs = await page.evaluate(_COLLECT_HREFS_JS, _FIRM_LINK_SELECTOR)
+        except Exception as e:
+            logger.debug("Ошибка при сборе ссылок: %s", e)
+            return links
         
-        for selector in link_selectors:
-            try:
-                elements = await self.page.query_selector_all(selector)
-                for element in elements:
-                    href = await element.get_attribute('href')
-                    if href:
-                        if any(word in href for word in ['firm', 'organization', 'branch']):
-                            if href.startswith('/'):
-                                full_url = f"https://2gis.kz{href}"
-                            elif href.startswith('http'):
-                                full_url = href
-                            else:
-                                continue
-                            links.add(full_url)
-            except:
-                continue
+        # Одна организация может встречаться с разными параметрами в ссылке - ключ по ее id
+        for href in hrefs:
+            url = href.split('#', 1)[0].split('?', 1)[0]
+            links.setdefault(_org_link_key(url) or url, url)
         
         return links
 
-    async def go_to_next_page_fixed(self, page_number):
-        """ИСПРАВЛЕННЫЙ переход на следующую страницу"""
+    async def go_to_next_page_fixed(self, page: Page, page_number) -> Optional[bool]:
+        """ИСПРАВЛЕННЫЙ переход на следующую страницу
+        
+        True - переход выполнен, False - переход не удался (можно повторить),
+        None - кнопки перехода в DOM нет, т.е. это последняя страница.
+        """
         try:
-            logger.info(f"🔍 Ищем кнопку страницы {page_number}...")
+            logger.info("🔍 Ищем кнопку страницы %s...", page_number)
             
-            # Сначала скроллим вниз чтобы пагинация была видна
-            await self.page.evaluate("window.scrollTo(0, document.body.scrollHeight)")
-            await self.random_delay(1, 2)
-            
-            # Ищем конкретную страницу
-            pagination_selectors = [
-                f'a:has-text("{page_number}")',
-                f'button:has-text("{page_number}")',
-                f'[data-page="{page_number}"]',
-            ]
+            # Запоминаем текущую выдачу, чтобы дождаться ее смены после клика
+            previous_first_href = await page.evaluate(_FIRST_FIRM_HREF_JS)
             
-            pagination_element = None
+            # Сначала скроллим вниз чтобы пагинация была видна
+            await page.evaluate("window.scrollTo(0, document.body.scrollHeight)")
+            await self.throttle_pause()
             
-            # Ищем точную кнопку страницы
-            for selector in pagination_selectors:
-                try:
-                    elements = await self.page.query_selector_all(selector)
-                    for element in elements:
-                        text = await element.text_content()
-                        if text and text.strip() == str(page_number):
-                            is_visible = await element.is_visible()
-                            if is_visible:
-                                pagination_element = element
-                                logger.info(f"✅ Найдена кнопка страницы {page_number}: {selector}")
-                                break
-                    if pagination_element:
-                        break
-                except:
-                    continue
+            # Кнопка страницы или "Следующая" ищется в браузере; ждем ее появления после прокрутки
+            try:
+                handle = await page.wait_for_function(_FIND_PAGINATION_JS, arg={
+                    'pageNumber': str(page_number),
+                    'nextTexts': _NEXT_PAGE_TEXTS,
+                    'nextSelectors': _NEXT_PAGE_SELECTORS
+                }, timeout=_PAGINATION_TIMEOUT)
+            except PlaywrightError:
+                logger.info("❌ Кнопка страницы %s не найдена", page_number)
+                return None
+            pagination_element = handle.as_element()
+            logger.info("✅ Найдена кнопка перехода на страницу %s", page_number)
             
-            # Если не нашли точную кнопку, ищем кнопку "Следующая" или ">"
-            if not pagination_element:
-                logger.info(f"🔍 Не найдена кнопка {page_number}, ищем 'Следующая'...")
+            try:
+                # Скроллим к элементу
+                await pagination_element.scroll_into_view_if_needed()
                 
-                next_selectors = [
-                    'a:has-text(">")',
-                    'button:has-text(">")', 
-                    'a:has-text("Следующая")',
-                    'button:has-text("Следующая")',
-                    '[class*="next"]',
-                    '[aria-label*="Next"]',
-                    '[aria-label*="Следующая"]'
-                ]
+                # Кликаем
+                await pagination_element.click()
+                logger.info("🎯 Кликнули на страницу %s", page_number)
                 
-                for selector in next_selectors:
-                    try:
-                        element = await self.page.query_selector(selector)
-                        if element:
-                            is_visible = await element.is_visible()
-                            is_enabled = await element.is_enabled()
-                            if is_visible and is_enabled:
-                                pagination_element = element
-                                logger.info(f"✅ Найдена кнопка 'Следующая': {selector}")
-                                break
-                    except:
-                        continue
-            
-            # Если нашли элемент - кликаем
-            if pagination_element:
-                try:
-                    # Скроллим к элементу
-                    await pagination_element.scroll_into_view_if_needed()
-                    await self.random_delay(1, 2)
-                    
-                    # Кликаем
-                    await pagination_element.click()
-                    logger.info(f"🎯 Кликнули на страницу {page_number}")
-                    
-                    # Ждем загрузки
-                    await self.random_delay(4, 6)
-                    
-                    # Проверяем что страница изменилась
-                    await self.page.wait_for_load_state('networkidle', timeout=10000)
-                    
-                    return True
-                    
-                except Exception as e:
-                    logger.error(f"❌ Ошибка при клике: {e}")
-                    return False
-            else:
-                # Последняя попытка - ищем ВСЕ элементы пагинации
-                logger.info("🔍 Последняя попытка - ищем все элементы пагинации...")
+                # Ждем загрузки: страница изменилась, когда в выдаче появились новые ссылки
+                await page.wait_for_function(_RESULTS_CHANGED_JS, arg=previous_first_href, timeout=10000)
                 
-                try:
-                    # Ищем все возможные элементы пагинации
-                    all_pagination = await self.page.query_selector_all('a, button')
-                    
-                    for element in all_pagination:
-                        try:
-                            text = await element.text_content()
-                            if text and text.strip() == str(page_number):
-                                is_visible = await element.is_visible()
-                                is_enabled = await element.is_enabled()
-                                
-                                if is_visible and is_enabled:
-                                    logger.info(f"✅ Найден элемент пагинации в общем поиске!")
-                                    await element.scroll_into_view_if_needed()
-                                    await self.random_delay(1, 2)
-                                    await element.click()
-                                    await self.random_delay(4, 6)
-                                    await self.page.wait_for_load_state('networkidle', timeout=10000)
-                                    return True
-                        except:
-                            continue
-                            
-                except:
-                    pass
+                return True
                 
-                logger.info(f"❌ Кнопка страницы {page_number} не найдена")
+            except Exception as e:
+                logger.error("❌ Ошибка при клике: %s", e)
                 return False
                 
         except Exception as e:
-            logger.error(f"💥 Ошибка при поиске пагинации: {e}")
+            logger.error("💥 Ошибка при поиске пагинации: %s", e)
             return False
             
-    async def extract_business_info(self, url: str, category: str) -> Optional[Dict]:
-        """Улучшенное извлечение информации с проверкой дубликатов"""
-        try:
-            logger.info(f"Переходим на страницу: {url}")
-            
-            # Переходим на страницу
-            await self.page.goto(url, wait_until="domcontentloaded", timeout=20000)
-            
-            # Ждем загрузки динамического контента
-            await self.wait_for_dynamic_content()
-            
-            # Сначала извлекаем название для проверки дубликатов
-            name = None
-            try:
-                name = await self.extract_text_by_selectors([
-                    'h1', 'h2', '[class*="title"]', '[class*="name"]', '[class*="header"]'
-                ])
-            except Exception as e:
-                logger.debug(f"Ошибка при извлечении названия: {e}")
-            
-            # Проверяем, не обрабатывали ли мы уже эту компанию
-            if name and self.is_company_already_processed(name):
-                logger.info(f"⏭️ Пропускаем дубликат: {name}")
-                return None
-            
-            # Если компания новая, продолжаем извлечение остальной информации
-            address = None
-            phone = None
-            website = None
-            whatsapp = None
-            instagram = None
-            
+    def make_api_item_listener(self, url: str, api_item: asyncio.Future):
+        """Обработчик ответов страницы, сохраняющий JSON карточки организации из API 2ГИС"""
+        firm_id_match = _FIRM_ID_RE.search(url)
+        firm_id = firm_id_match.group(1) if firm_id_match else None
+        
+        async def on_response(response):
+            if api_item.done() or not _API_ITEM_URL_RE.search(response.url):
+                return
+            if firm_id and firm_id not in response.url:
+                return
+            if not response.headers.get('content-type', '').startswith('application/json'):
+                return
             try:
-                address = await self.extract_address()
+                data = await response.json()
+                items = (data.get('result') or {}).get('items') or []
+                if items and not api_item.done():
+                    api_item.set_result(items[0])
             except Exception as e:
-                logger.debug(f"Ошибка при извлечении адреса: {e}")
+                logger.debug("Ошибка при разборе ответа API: %s", e)
+        
+        return on_response
+    
+    async def parse_api_item(self, item: Dict) -> Dict:
+        """Извлечение полей организации из JSON карточки API 2ГИС"""
+        fields = {
+            'name': item.get('name'),
+            'address': item.get('address_name') or item.get('full_address_name'),
+            'phone': None,
+            'website': None,
+            'whatsapp': None,
+            'instagram': None
+        }
+        
+        for group in item.get('contact_groups') or []:
+            for contact in group.get('contacts') or []:
+                contact_type = contact.get('type')
+                value = contact.get('value') or contact.get('text')
+                contact_url = contact.get('url') or ''
+                
+                if contact_type == 'phone' and not fields['phone']:
+                    fields['phone'] = value
+                elif contact_type == 'website' and not fields['website']:
+                    text = (contact.get('text') or '').strip()
+                    if self.is_valid_domain(text):
+                        fields['website'] = text if text.startswith('http') else f"https://{text}"
+                    elif 'link.2gis.com' in contact_url:
+                        fields['website'] = await self.decode_2gis_website_link(contact_url)
+                elif contact_type == 'whatsapp' and not fields['whatsapp']:
+                    if 'link.2gis.com' in contact_url:
+                        fields['whatsapp'] = await self.decode_2gis_link(contact_url)
+                    else:
+                        fields['whatsapp'] = contact_url or None
+                elif contact_type == 'instagram' and not fields['instagram']:
+                    fields['instagram'] = contact_url or value
+        
+        return fields
+    
+    async def fetch_fields_from_api(self, url: str) -> Optional[Dict]:
+        """Получение полей организации напрямую из API каталога 2ГИС, без браузера"""
+        firm_id_match = _FIRM_ID_RE.search(url)
+        if not self.http_client or not firm_id_match:
+            return None
             
-            # Дополнительная проверка по адресу (если название слишком общее)
-            if name and address and self.is_company_already_processed(name, address):
-                logger.info(f"⏭️ Пропускаем дубликат по адресу: {name} - {address}")
-                return None
+        try:
+            async with self.api_semaphore:
+                response = await self.http_client.get(_CATALOG_API_URL, params={
+                    'id': firm_id_match.group(1),
+                    'key': self.api_key,
+                    'fields': _CATALOG_API_FIELDS
+                })
+            response.raise_for_status()
+            items = (response.json().get('result') or {}).get('items') or []
+        except Exception as e:
+            logger.debug("Ошибка запроса к API каталога для %s: %s", url, e)
+            return None
             
+        fields = await self.parse_api_item(items[0]) if items else None
+        return fields if fields and fields['name'] else None
+    
+    async def extract_fields_from_dom(self, page: Page, wait_header: bool = True) -> Optional[Dict]:
+        """Извлечение полей организации из DOM страницы (None - если это дубликат)
+        
+        wait_header=False - заголовок карточки уже дождались (или ждать его больше нет смысла).
+        """
+        # HTML предыдущей карточки на этой странице больше не актуален
+        self._page_html_cache.pop(page, None)
+        
+        # Ждем загрузки динамического контента
+        if wait_header:
+            await self.wait_for_dynamic_content(page)
+        
+        # Снимаем все поля и текст страницы за один вызов в браузере
+        try:
+            snapshot = await self.get_page_snapshot(page)
+        except Exception as e:
+            logger.debug("Ошибка при получении данных страницы: %s", e)
+            snapshot = {'text': '', 'name': None, 'address': None, 'phones': [],
+                        'whatsapp': None, 'instagram': None, 'websiteCandidates': None}
+        
+        # Сначала проверяем название на дубликаты
+        name = snapshot['name']
+        if name and self.is_company_already_processed(name):
+            logger.info("⏭️ Пропускаем дубликат: %s", name)
+            self._duplicates_skipped += 1
+            return None
+        
+        # Если компания новая, продолжаем извлечение остальной информации
+        fields = {
+            'name': name,
+            'address': self.address_from_snapshot(snapshot),
+            'phone': None,
+            'website': None,
+            'whatsapp': None,
+            'instagram': None
+        }
+        
+        # Дополнительная проверка по адресу (если название слишком общее)
+        if name and fields['address'] and self.is_company_already_processed(name, fields['address']):
+            logger.info("⏭️ Пропускаем дубликат по адресу: %s - %s", name, fields['address'])
+            self._duplicates_skipped += 1
+            return None
+        
+        fields['phone'] = self.phone_from_snapshot(snapshot)
+        
+        try:
+            fields['website'] = await self.extract_website(page, snapshot['websiteCandidates'])
+        except Exception as e:
+            logger.debug("Ошибка при извлечении сайта: %s", e)
+        
+        # Прямые ссылки уже есть в снимке - полный поиск нужен только без них
+        fields['whatsapp'] = snapshot['whatsapp']
+        if not fields['whatsapp']:
             try:
-                phone = await self.extract_phone()
+                fields['whatsapp'] = await self.extract_whatsapp(page, snapshot['text'] or None)
             except Exception as e:
-                logger.debug(f"Ошибка при извлечении телефона: {e}")
-            
+                logger.warning("Ошибка при извлечении WhatsApp: %s", e)
+        
+        fields['instagram'] = snapshot['instagram']
+        if not fields['instagram']:
             try:
-                website = await self.extract_website()  # Используем исправленную версию
+                fields['instagram'] = await self.extract_instagram(page, snapshot['text'] or None)
             except Exception as e:
-                logger.debug(f"Ошибка при извлечении сайта: {e}")
+                logger.debug("Ошибка при извлечении Instagram: %s", e)
+        
+        return fields
+            
+    def build_business_result(self, fields: Dict, category: str) -> Optional[Dict]:
+        """Формирование строки результата и регистрация компании (None - если это дубликат)"""
+        name = fields['name']
+        address = fields['address']
+        phone = fields['phone']
+        website = fields['website']
+        whatsapp = fields['whatsapp']
+        instagram = fields['instagram']
+        
+        result = {
+            'Название': name or 'Не указано',
+            'Адрес': address or 'Не указано',
+            'Телефон': phone or 'Не указано', 
+            'Сайт': website or 'Не указано',
+            'WhatsApp': whatsapp or 'Не указано',
+            'Instagram': instagram or 'Не указано',
+            'Категория': category,
+            'Есть сайт': 'Да' if website and website != 'Не указано' else 'Нет'
+        }
+        
+        # Добавляем компанию в список обработанных. Пока страница загружалась,
+        # параллельная задача могла уже добавить эту компанию - проверяем повторно
+        # (между проверкой и добавлением нет await, поэтому это атомарно)
+        if name:
+            if self.is_company_already_processed(name, address):
+                logger.info("⏭️ Пропускаем дубликат: %s", name)
+                self._duplicates_skipped += 1
+                return None
+            self.add_company_to_processed(name, result)
+        
+        logger.info("✅ Собрана информация: %s, %s, %s", result['Название'], result['Адрес'], result['Телефон'])
+        if website and website != 'Не указано':
+            logger.info("🌐 Сайт: %s", result['Сайт'])
+        if whatsapp and whatsapp != 'Не указано':
+            logger.info("📱 WhatsApp: %s", result['WhatsApp'])
+        if instagram and instagram != 'Не указано':
+            logger.info("📸 Instagram: %s", result['Instagram'])
+        
+        return result
             
-            try:
-                whatsapp = await self.extract_whatsapp()
-            except Exception as e:
-                logger.warning(f"Ошибка при извлечении WhatsApp: {e}")
+    async def extract_business_info(self, url: str, category: str, page: Page) -> Optional[Dict]:
+        """Улучшенное извлечение информации с проверкой дубликатов"""
+        try:
+            logger.info("Переходим на страницу: %s", url)
             
+            # Перехватываем JSON карточки, который страница сама загружает из API 2ГИС
+            api_item = asyncio.get_running_loop().create_future()
+            on_response = self.make_api_item_listener(url, api_item)
+            page.on('response', on_response)
             try:
-                instagram = await self.extract_instagram()
-            except Exception as e:
-                logger.debug(f"Ошибка при извлечении Instagram: {e}")
-            
-            result = {
-                'Название': name or 'Не указано',
-                'Адрес': address or 'Не указано',
-                'Телефон': phone or 'Не указано', 
-                'Сайт': website or 'Не указано',
-                'WhatsApp': whatsapp or 'Не указано',
-                'Instagram': instagram or 'Не указано',
-                'Категория': category,
-                'Есть сайт': 'Да' if website and website != 'Не указано' else 'Нет'
-            }
-            
-            # Добавляем компанию в список обработанных
-            if name:
-                self.add_company_to_processed(name, result)
-            
-            logger.info(f"✅ Собрана информация: {result['Название']}, {result['Адрес']}, {result['Телефон']}")
-            if website and website != 'Не указано':
-                logger.info(f"🌐 Сайт: {result['Сайт']}")
-            if whatsapp and whatsapp != 'Не указано':
-                logger.info(f"📱 WhatsApp: {result['WhatsApp']}")
-            if instagram and instagram != 'Не указано':
-                logger.info(f"📸 Instagram: {result['Instagram']}")
+                await self.throttle_pause()
+                # Переходим на страницу: ждем только ответа сервера - данные приходят из API,
+                # а разбор DOM сам дожидается заголовка карточки
+                await page.goto(url, wait_until="commit", timeout=20000)
+                self.note_page_ok()
+                item = await self.wait_for_api_item(page, api_item)
+            finally:
+                page.remove_listener('response', on_response)
+            
+            fields = await self.parse_api_item(item) if item else None
+            if fields and fields['name']:
+                logger.debug("Данные получены из API: %s", fields['name'])
+            else:
+                # API-ответ не перехвачен - разбираем отрисованную страницу
+                fields = await self.extract_fields_from_dom(page, wait_header=False)
+                if fields is None:
+                    return None
             
-            return result
+            return self.build_business_result(fields, category)
             
         except Exception as e:
-            logger.error(f"Критическая ошибка при извлечении информации с {url}: {e}")
+            logger.error("Критическая ошибка при извлечении информации с %s: %s", url, e)
+            self.note_page_fail()
             return None
             
-    async def extract_text_by_selectors(self, selectors: List[str]) -> Optional[str]:
-        """Извлечение текста по списку селекторов"""
-        for selector in selectors:
-            try:
-                element = await self.page.query_selector(selector)
-                if element:
-                    text = await element.text_content()
-                    if text and text.strip():
-                        return text.strip()
-            except:
-                continue
-        return None
+    async def wait_for_api_item(self, page: Page, api_item: asyncio.Future) -> Optional[Dict]:
+        """Ожидание JSON карточки из API наперегонки с заголовком карточки в DOM
+        
+        Если страница отрисована без запроса к API (или он запаздывает), после появления
+        заголовка ответ API ждем только _API_ITEM_GRACE секунд, а не весь _API_ITEM_TIMEOUT.
+        """
+        header = asyncio.ensure_future(
+            page.wait_for_selector('h1', state='attached', timeout=_API_ITEM_TIMEOUT * 1000)
+        )
+        try:
+            done, _ = await asyncio.wait(
+                {api_item, header}, timeout=_API_ITEM_TIMEOUT, return_when=asyncio.FIRST_COMPLETED
+            )
+            if api_item not in done and header in done:
+                await asyncio.wait({api_item}, timeout=_API_ITEM_GRACE)
+        finally:
+            if not header.done():
+                header.cancel()
+            # Ошибку ожидания заголовка (таймаут) забираем, чтобы asyncio не ругался на нее
+            header.add_done_callback(lambda task: task.cancelled() or task.exception())
+        return api_item.result() if api_item.done() else None
         
-    async def extract_address(self) -> Optional[str]:
+    async def get_page_snapshot(self, page: Page) -> Dict:
+        """Снимок полей карточки и текста страницы одним вызовом в браузере"""
+        return await page.evaluate(_PAGE_SNAPSHOT_JS, {
+            'nameSelectors': _NAME_SELECTORS,
+            'addressSelectors': _ADDRESS_SELECTORS,
+            'phoneSelectors': _PHONE_SELECTORS,
+            'svgSelectors': _GLOBE_SVG_SELECTORS,
+            'pathPattern': _GLOBE_PATH_PATTERN
+        })
+        
+    async def get_page_html(self, page: Page) -> str:
+        """HTML страницы - запрашивается из браузера один раз на карточку"""
+        html = self._page_html_cache.get(page)
+        if html is None:
+            html = await page.content()
+            self._page_html_cache[page] = html
+        return html
+        
+    async def page_html_matches(self, page: Page, pattern: re.Pattern) -> bool:
+        """Есть ли в HTML страницы совпадение с pattern (регулярка с re.IGNORECASE)
+        
+        Уже полученный HTML проверяется в Python, иначе проверка выполняется в браузере -
+        в Python передается только результат.
+        """
+        html = self._page_html_cache.get(page)
+        if html is not None:
+            return pattern.search(html) is not None
+        return await page.evaluate(_HTML_PROBE_JS, pattern.pattern)
+        
+    def address_from_snapshot(self, snapshot: Dict) -> Optional[str]:
         """Извлечение адреса"""
         # Сначала пробуем стандартные селекторы
-        address_selectors = [
-            '[class*="address"]',
-            '[class*="location"]', 
-            '.address',
-            '.location'
-        ]
-        
-        address = await self.extract_text_by_selectors(address_selectors)
-        if address:
-            return address
+        if snapshot['address']:
+            return snapshot['address']
             
         # Если не нашли, ищем в тексте страницы
-        try:
-            page_text = await self.page.text_content('body')
-            if page_text:
-                # Паттерны для поиска адреса
-                address_patterns = [
-                    r'ЖК\s+[А-Яа-я\s]+,\s*улица\s+[А-Яа-я\s]+,\s*\d+',
-                    r'улица\s+[А-Яа-я\s]+,\s*\d+[А-Яа-я\s]*',
-                    r'проспект\s+[А-Яа-я\s]+,\s*\d+[А-Яа-я\s]*',
-                    r'бульвар\s+[А-Яа-я\s]+,\s*\d+[А-Яа-я\s]*',
-                    r'[А-Яа-я\s]+(район|микрорайон)[А-Яа-я\s\d,]*',
-                    r'Астана[,\s]+[А-Яа-я\s\d,]+'
-                ]
-                
-                for pattern in address_patterns:
-                    match = re.search(pattern, page_text)
-                    if match:
-                        return match.group().strip()
-        except:
-            pass
+        if snapshot['text']:
+            return _search_by_priority(_ADDRESS_RE, snapshot['text'])
             
         return None
         
-    async def extract_phone(self) -> Optional[str]:
+    def phone_from_snapshot(self, snapshot: Dict) -> Optional[str]:
         """Извлечение телефона"""
         # Ищем кнопки и ссылки с телефонами
-        phone_selectors = [
-            'a[href^="tel:"]',
-            '[class*="phone"]',
-            'button[class*="phone"]'
-        ]
-        
-        for selector in phone_selectors:
-            try:
-                elements = await self.page.query_selector_all(selector)
-                for element in elements:
-                    # Проверяем href
-                    href = await element.get_attribute('href')
-                    if href and href.startswith('tel:'):
-                        return href.replace('tel:', '').strip()
-                    
-                    # Проверяем текст
-                    text = await element.text_content()
-                    if text and re.search(r'[\d\-\+\(\)\s]{7,}', text):
-                        return text.strip()
-            except:
-                continue
+        for item in snapshot['phones']:
+            # Проверяем href
+            href = item['href']
+            if href and href.startswith('tel:'):
+                return href[len('tel:'):].strip()
+            
+            # Проверяем текст
+            text = item['text']
+            if text and _PHONE_TEXT_RE.search(text):
+                return text.strip()
                 
         # Ищем в тексте страницы
-        try:
-            page_text = await self.page.text_content('body')
-            if page_text:
-                phone_patterns = [
-                    r'\+7\s*[-\(\s]*\d{3}\s*[-\)\s]*\d{3}[-\s]*\d{2}[-\s]*\d{2}',
-                    r'8\s*[-\(\s]*\d{3}\s*[-\)\s]*\d{3}[-\s]*\d{2}[-\s]*\d{2}',
-                    r'\+7\d{10}',
-                    r'8\d{10}'
-                ]
-                
-                for pattern in phone_patterns:
-                    match = re.search(pattern, page_text)
-                    if match:
-                        return match.group().strip()
-        except:
-            pass
+        if snapshot['text']:
+            return _search_by_priority(_PHONE_RE, snapshot['text'])
             
         return None
 
-    async def wait_for_dynamic_content(self):
-        """Улучшенное ожидание загрузки динамического контента"""
+    async def wait_for_dynamic_content(self, page: Page):
+        """Ожидание появления заголовка карточки организации"""
         try:
             logger.debug("Ждем загрузки динамического контента...")
-            
-            # Ждем загрузки сети
-            await self.page.wait_for_load_state('networkidle', timeout=15000)
-            
-            # Дополнительная задержка для JavaScript
-            await asyncio.sleep(5)
-            
-            # Ждем появления ключевых элементов
-            key_selectors = [
-                'h1, h2',  # Заголовок
-                '[class*="contact"]',  # Контактная информация
-                '[class*="phone"]',   # Телефон
-                'button, a'  # Кнопки и ссылки
-            ]
-            
-            for selector in key_selectors:
-                try:
-                    await self.page.wait_for_selector(selector, timeout=3000)
-                    logger.debug(f"Найден элемент: {selector}")
-                    break
-                except:
-                    continue
-            
-            # Еще немного подождем для полной загрузки
-            await asyncio.sleep(2)
-            
+            await page.wait_for_selector('h1', state='attached', timeout=5000)
             logger.debug("Динамический контент загружен")
-            
         except Exception as e:
-            logger.debug(f"Таймаут при ожидании динамического контента: {e}")
+            logger.debug("Таймаут при ожидании динамического контента: %s", e)
 
     async def decode_2gis_website_link(self, link: str) -> Optional[str]:
         """Улучшенное декодирование 2ГИС ссылок для сайтов"""
-        try:
-            import base64
-            import urllib.parse
-            
-            if 'link.2gis.com' not in link:
-                return None
-                
-            logger.debug(f"Декодируем 2ГИС ссылку: {link}")
-            
-            # Извлекаем закодированную часть
-            parts = link.split('/')
-            if len(parts) < 2:
-                return None
-                
-            encoded_part = parts[-1]
-            
-            # Убираем query параметры
-            if '?' in encoded_part:
-                encoded_part = encoded_part.split('?')[0]
-            if '#' in encoded_part:
-                encoded_part = encoded_part.split('#')[0]
-                
-            try:
-                # Пробуем декодировать с разными вариантами padding
-                for padding in ['', '=', '==', '===']:
-                    try:
-                        padded_data = encoded_part + padding
-                        decoded_bytes = base64.b64decode(padded_data)
-                        decoded_string = decoded_bytes.decode('utf-8')
-                        
-                        logger.debug(f"Декодированная строка: {decoded_string[:200]}...")
-                        
-                        # Ищем URL в декодированной строке
-                        url_patterns = [
-                            r'https?://([a-zA-Z0-9][-a-zA-Z0-9]*\.(?:kz|com|ru|org|net|biz|cafe|coffee)(?:/[^\s]*)?)',
-                            r'http://([a-zA-Z0-9][-a-zA-Z0-9]*\.(?:kz|com|ru|org|net|biz|cafe|coffee)(?:/[^\s]*)?)',
-                            r'([a-zA-Z0-9][-a-zA-Z0-9]*\.(?:kz|com|ru|org|net|biz|cafe|coffee)(?:/[^\s]*)?)'
-                        ]
-                        
-                        for pattern in url_patterns:
-                            matches = re.findall(pattern, decoded_string, re.IGNORECASE)
-                            for match in matches:
-                                domain = match if isinstance(match, str) else match[0]
-                                
-                                # Исключаем служебные домены
-                                if not any(bad in domain.lower() for bad in ['2gis', 'sberbank', 'yandex', 'google']):
-                                    if len(domain) > 6:
-                                        # Проверяем, есть ли уже протокол
-                                        if domain.startswith('http'):
-                                            result = domain
-                                        else:
-                                            result = f"https://{domain}"
-                                        logger.info(f"Декодирован сайт: {result}")
-                                        return result
-                        
-                        break  # Если декодирование прошло успешно, выходим
-                    except:
-                        continue
-                        
-            except Exception as e:
-                logger.debug(f"Ошибка декодирования: {e}")
-                
+        if 'link.2gis.com' not in link:
             return None
             
+        logger.debug("Декодируем 2ГИС ссылку: %s", link)
+        
+        try:
+            result = _website_from_2gis_link(link)
         except Exception as e:
-            logger.debug(f"Ошибка при декодировании ссылки: {e}")
+            logger.debug("Ошибка при декодировании ссылки: %s", e)
             return None
+            
+        if result:
+            logger.info("Декодирован сайт: %s", result)
+        return result
 
-    async def extract_website(self) -> Optional[str]:
+    async def extract_website(self, page: Page, candidates: Optional[List[Dict]] = None) -> Optional[str]:
         """Исправленное извлечение сайта по SVG иконке глобуса и специфичным классам"""
         try:
             logger.info("Ищем сайт по SVG иконке глобуса...")
 
-            # Ищем SVG с иконкой глобуса (земли)
-            svg_selectors = [
-                'svg[fill="#028eff"]',  # Конкретный цвет из примера
-                'svg',  # Все SVG элементы
-                'div._1iftozu svg'  # SVG внутри div с классом _1iftozu
-            ]
-            
-            for svg_selector in svg_selectors:
-                try:
-                    svg_elements = await self.page.query_selector_all(svg_selector)
-                    
-                    for svg in svg_elements:
-                        try:
-                            # Проверяем, что это иконка глобуса по path
-                            path_element = await svg.query_selector('path')
-                            if path_element:
-                                path_d = await path_element.get_attribute('d')
-                                # Проверяем характерные части path для иконки глобуса
-                                if path_d and any(pattern in path_d for pattern in ['M12 4a8 8', 'a8 8 0', 'A6 6 0']):
-                                    logger.debug("Найдена SVG иконка глобуса")
-                                    
-                                    # Ищем родительский контейнер с сайтом
-                                    current_element = svg
-                                    for level in range(5):  # Проверяем до 5 уровней вверх
-                                        try:
-                                            parent = await current_element.query_selector('xpath=..')
-                                            if not parent:
-                                                break
-                                                
-                                            # Ищем div с классом _49kxlr рядом или внутри
-                                            website_containers = await parent.query_selector_all('div._49kxlr, ._49kxlr')
-                                            
-                                            for container in website_containers:
-                                                # Ищем ссылку внутри контейнера
-                                                links = await container.query_selector_all('a')
-                                                for link in links:
-                                                    # Проверяем href
-                                                    href = await link.get_attribute('href')
-                                                    if href and 'link.2gis.com' in href:
-                                                        # Декодируем 2ГИС ссылку
-                                                        decoded_site = await self.decode_2gis_website_link(href)
-                                                        if decoded_site:
-                                                            logger.info(f"Декодирован сайт: {decoded_site}")
-                                                            return decoded_site
-                                                    
-                                                    # Проверяем текст ссылки (должен быть доменом)
-                                                    link_text = await link.text_content()
-                                                    if link_text:
-                                                        link_text = link_text.strip()
-                                                        logger.debug(f"Найден текст ссылки: {link_text}")
-                                                        
-                                                        # Проверяем, что это домен (включая поддомены)
-                                                        if self.is_valid_domain(link_text):
-                                                            # НЕ убираем поддомены - берем как есть
-                                                            if not link_text.startswith('http'):
-                                                                result = f"https://{link_text}"
-                                                            else:
-                                                                result = link_text
-                                                            logger.info(f"Найден сайт: {result}")
-                                                            return result
-                                            
-                                            current_element = parent
-                                        except:
-                                            break
-                        except:
-                            continue
-                except Exception as e:
-                    logger.debug(f"Ошибка при поиске SVG {svg_selector}: {e}")
-                    continue
-
-            # Если не нашли по SVG, пробуем прямой поиск по классам
-            logger.info("Поиск по SVG не дал результатов, ищем напрямую по классам...")
-            
-            try:
-                # Ищем все элементы с классом _49kxlr
-                website_elements = await self.page.query_selector_all('._49kxlr, div._49kxlr')
-                logger.debug(f"Найдено элементов с классом _49kxlr: {len(website_elements)}")
+            # Все ссылки-кандидаты собираются одним вызовом в браузере (обычно уже есть в снимке страницы)
+            if candidates is None:
+                candidates = await page.evaluate(
+                    _WEBSITE_CANDIDATES_JS,
+                    {'svgSelectors': _GLOBE_SVG_SELECTORS, 'pathPattern': _GLOBE_PATH_PATTERN}
+                )
+            logger.debug("Найдено ссылок-кандидатов на сайт: %d", len(candidates))
+            
+            for candidate in candidates:
+                # Проверяем href
+                href = candidate.get('href')
+                if href and 'link.2gis.com' in href:
+                    # Декодируем 2ГИС ссылку
+                    decoded_site = await self.decode_2gis_website_link(href)
+                    if decoded_site:
+                        logger.info("Декодирован сайт: %s", decoded_site)
+                        return decoded_site
                 
-                for element in website_elements:
-                    try:
-                        # Ищем ссылки внутри
-                        links = await element.query_selector_all('a')
-                        for link in links:
-                            # Проверяем href на 2gis ссылку
-                            href = await link.get_attribute('href')
-                            if href and 'link.2gis.com' in href:
-                                decoded_site = await self.decode_2gis_website_link(href)
-                                if decoded_site:
-                                    logger.info(f"Декодирован сайт из _49kxlr: {decoded_site}")
-                                    return decoded_site
-                            
-                            # Проверяем текст ссылки
-                            link_text = await link.text_content()
-                            if link_text:
-                                link_text = link_text.strip()
-                                
-                                if self.is_valid_domain(link_text):
-                                    if not link_text.startswith('http'):
-                                        result = f"https://{link_text}"
-                                    else:
-                                        result = link_text
-                                    logger.info(f"Найден сайт в _49kxlr: {result}")
-                                    return result
-                    except Exception as e:
-                        logger.debug(f"Ошибка при обработке элемента _49kxlr: {e}")
-                        continue
-            except Exception as e:
-                logger.debug(f"Ошибка при поиске по классу _49kxlr: {e}")
+                # Проверяем текст ссылки (должен быть доменом)
+                link_text = (candidate.get('text') or '').strip()
+                if link_text and self.is_valid_domain(link_text):
+                    # НЕ убираем поддомены - берем как есть
+                    if not link_text.startswith('http'):
+                        result = f"https://{link_text}"
+                    else:
+                        result = link_text
+                    logger.info("Найден сайт: %s", result)
+                    return result
 
             logger.info("Сайт не найден")
             return None
                     
         except Exception as e:
-            logger.error(f"Критическая ошибка при поиске сайта: {e}")
+            logger.error("Критическая ошибка при поиске сайта: %s", e)
             return None
 
-    def is_valid_domain(self, domain: str) -> bool:
-        """Проверка, что строка является валидным доменом (включая поддомены)"""
-        try:
-            if not domain:
-                return False
-                
-            # Убираем протокол если есть
-            domain = domain.replace('https://', '').replace('http://', '')
-            
-            # Убираем путь если есть
-            domain = domain.split('/')[0]
-            
-            # Проверяем базовый паттерн домена (включая поддомены)
-            domain_pattern = r'^([a-zA-Z0-9]([a-zA-Z0-9\-]{0,61}[a-zA-Z0-9])?\.)+[a-zA-Z]{2,}$'
-            
-            if re.match(domain_pattern, domain):
-                # Дополнительные проверки
-                parts = domain.split('.')
-                
-                # Должно быть минимум 2 части (домен.зона)
-                if len(parts) < 2:
-                    return False
-                    
-                # Проверяем зону (последняя часть)
-                tld = parts[-1].lower()
-                valid_tlds = ['com', 'ru', 'kz', 'org', 'net', 'biz', 'info', 'cafe', 'coffee', 'shop', 'store']
-                
-                if tld in valid_tlds:
-                    # Исключаем служебные домены
-                    excluded_domains = ['2gis', 'google', 'yandex', 'facebook', 'vk']
-                    if not any(excluded in domain.lower() for excluded in excluded_domains):
-                        return True
+    @staticmethod
+    @functools.lru_cache(maxsize=4096)
+    def is_valid_domain(domain: str) -> bool:
+        """Проверка, что строка является валидным доменом (результат кэшируется - сайты повторяются)"""
+        if not domain:
+            return False
             
+        # Отделяем хост от протокола, пути и параметров (квадратные скобки в тексте ссылки -
+        # это не адрес, urlsplit на них падает)
+        try:
+            domain = urlsplit(domain if '://' in domain else '//' + domain, allow_fragments=False).netloc
+        except ValueError:
+            return False
+        
+        # Быстрые проверки до регулярки: точка обязательна, края - не точка/дефис
+        if '.' not in domain or len(domain) < 4 or domain[0] in '-.' or domain[-1] in '-.':
             return False
             
-        except:
+        # Проверяем зону (последняя часть)
+        if domain.rpartition('.')[2].lower() not in _VALID_TLDS:
             return False
         
+        # Проверяем базовый паттерн домена (включая поддомены)
+        if not _DOMAIN_RE.match(domain):
+            return False
+            
+        # Исключаем служебные домены
+        return not _EXCLUDED_DOMAIN_RE.search(domain)
+        
     async def decode_2gis_link(self, link: str) -> Optional[str]:
         """Улучшенное декодирование ссылок 2ГИС для WhatsApp"""
         try:
-            import base64
-            import urllib.parse
-            
             if 'link.2gis.com' not in link:
                 return None
                 
-            logger.debug(f"Пытаемся декодировать: {link}")
+            logger.debug("Пытаемся декодировать: %s", link)
             
-            # Извлекаем base64 часть после последнего /
-            parts = link.split('/')
-            if len(parts) < 2:
-                return None
-                
-            encoded_part = parts[-1]
-            
-            # Удаляем query параметры если есть
-            if '?' in encoded_part:
-                encoded_part = encoded_part.split('?')[0]
-            if '#' in encoded_part:
-                encoded_part = encoded_part.split('#')[0]
-                
-            try:
-                # Пробуем разные варианты декодирования
-                for padding in ['', '=', '==', '===']:
-                    try:
-                        padded_data = encoded_part + padding
-                        decoded_bytes = base64.b64decode(padded_data)
-                        decoded_string = decoded_bytes.decode('utf-8')
-                        
-                        # Ищем wa.me ссылку в декодированной строке
-                        wa_patterns = [
-                            r'(https://wa\.me/[^\s%"\']+)',
-                            r'wa\.me/(\d+)',
-                            r'whatsapp://send\?phone=(\d+)'
-                        ]
-                        
-                        for pattern in wa_patterns:
-                            matches = re.findall(pattern, decoded_string)
-                            for match in matches:
-                                if match.startswith('https://'):
-                                    wa_url = urllib.parse.unquote(match)
-                                    logger.info(f"Декодирована ссылка WhatsApp: {wa_url}")
-                                    return wa_url
-                                elif match.isdigit():
-                                    wa_url = f"https://wa.me/{match}"
-                                    logger.info(f"Создана ссылка WhatsApp: {wa_url}")
-                                    return wa_url
-                        
-                        break  # Если декодирование прошло успешно, выходим
-                    except:
-                        continue
-                        
-            except Exception as e:
-                logger.debug(f"Ошибка декодирования base64: {e}")
-                
-            return None
+            wa_url = _whatsapp_from_2gis_link(link)
+            if wa_url:
+                logger.info("Декодирована ссылка WhatsApp: %s", wa_url)
+            return wa_url
             
         except Exception as e:
-            logger.debug(f"Ошибка при декодировании ссылки 2gis: {e}")
+            logger.debug("Ошибка при декодировании ссылки 2gis: %s", e)
             return None
 
-    async def extract_whatsapp(self) -> Optional[str]:
-        """Упрощенное и стабильное извлечение WhatsApp"""
+    async def extract_whatsapp(self, page: Page, page_text: Optional[str] = None) -> Optional[str]:
+        """Упрощенное и стабильное извлечение WhatsApp (page_text - уже полученный текст body)"""
         try:
-            # 1. Сначала ищем прямые ссылки на WhatsApp
-            direct_selectors = [
-                'a[href*="wa.me"]',
-                'a[href*="whatsapp"]',
-                'a[href*="link.2gis.com"]'
-            ]
-            
-            for selector in direct_selectors:
-                try:
-                    links = await self.page.query_selector_all(selector)
-                    for link in links:
-                        href = await link.get_attribute('href')
-                        if href:
-                            if 'wa.me' in href or 'whatsapp' in href:
-                                logger.info(f"Найдена прямая ссылка WhatsApp: {href}")
-                                return href
-                            elif 'link.2gis.com' in href:
-                                # Пытаемся декодировать ссылку 2gis
-                                decoded = await self.decode_2gis_link(href)
-                                if decoded:
-                                    return decoded
-                except Exception as e:
-                    logger.debug(f"Ошибка при поиске {selector}: {e}")
-                    continue
+            # 1. Сначала ищем прямые ссылки на WhatsApp - все href одним вызовом в браузере,
+            # дальше фильтруем в Python
+            try:
+                hrefs = await page.evaluate(_COLLECT_HREFS_JS, _WA_DIRECT_LINK_SELECTOR)
+            except PlaywrightError as e:
+                logger.debug("Ошибка при поиске прямых ссылок: %s", e)
+                hrefs = []
+            
+            # Приоритет прежний: wa.me, затем whatsapp, затем ссылки 2ГИС
+            for marker in ('wa.me', 'whatsapp'):
+                for href in hrefs:
+                    if marker in href:
+                        logger.info("Найдена прямая ссылка WhatsApp: %s", href)
+                        return href
+            
+            # Ссылки 2ГИС, которые уже пробовали декодировать
+            checked_gis_links = set()
+            
+            for href in hrefs:
+                if 'link.2gis.com' in href and href not in checked_gis_links:
+                    checked_gis_links.add(href)
+                    # Пытаемся декодировать ссылку 2gis
+                    decoded = await self.decode_2gis_link(href)
+                    if decoded:
+                        return decoded
 
-            # 2. Ищем кнопки WhatsApp БЕЗ КЛИКА - только проверяем атрибуты
-            whatsapp_selectors = [
-                'button[title*="WhatsApp"], button[title*="whatsapp"]',
-                'a[title*="WhatsApp"], a[title*="whatsapp"]',
-                'div[title*="WhatsApp"], div[title*="whatsapp"]',
-                '[class*="whatsapp"]',
-                '[data-social="whatsapp"]',
-                'button:has-text("WhatsApp")',
-                'a:has-text("WhatsApp")'
-            ]
-            
-            for selector in whatsapp_selectors:
-                try:
-                    buttons = await self.page.query_selector_all(selector)
-                    for button in buttons:
-                        # Проверяем различные атрибуты БЕЗ КЛИКА
-                        attributes_to_check = [
-                            'href', 'data-url', 'data-link', 'data-phone', 
-                            'data-action', 'data-contact', 'onclick',
-                            'data-whatsapp', 'data-phone-number'
-                        ]
-                        
-                        for attr in attributes_to_check:
-                            try:
-                                attr_value = await button.get_attribute(attr)
-                                if not attr_value:
-                                    continue
-                                    
-                                # Ищем номер телефона в атрибуте
-                                phone_patterns = [
-                                    r'(\+?7\d{10})',
-                                    r'wa\.me/(\d+)',
-                                    r'whatsapp://send\?phone=(\d+)'
-                                ]
-                                
-                                for pattern in phone_patterns:
-                                    match = re.search(pattern, attr_value)
-                                    if match:
-                                        phone = match.group(1).replace('+', '')
-                                        if not phone.startswith('7') and len(phone) == 10:
-                                            phone = '7' + phone
-                                        elif not phone.startswith('7') and len(phone) == 11:
-                                            phone = phone
-                                        result = f"https://wa.me/{phone}"
-                                        logger.info(f"Создана ссылка WhatsApp из {attr}: {result}")
-                                        return result
-                                
-                                # Ищем готовую ссылку WhatsApp
-                                if 'wa.me' in attr_value or 'whatsapp' in attr_value:
-                                    wa_match = re.search(r'(https://wa\.me/[^\s\'"]+)', attr_value)
-                                    if wa_match:
-                                        logger.info(f"Найдена ссылка WhatsApp в {attr}: {wa_match.group(1)}")
-                                        return wa_match.group(1)
-                            except Exception as e:
-                                logger.debug(f"Ошибка при проверке атрибута {attr}: {e}")
-                                continue
-                except Exception as e:
-                    logger.debug(f"Ошибка при поиске {selector}: {e}")
-                    continue
+            # 2. Ищем кнопки WhatsApp БЕЗ КЛИКА - только проверяем атрибуты. Атрибуты всех
+            # кнопок (в порядке селекторов) читаются одним вызовом в браузере
+            try:
+                buttons_attributes = await page.evaluate(
+                    _WA_BUTTONS_ATTRS_JS, [_WA_BUTTON_SELECTORS, _WA_BUTTON_TEXT_TAGS, _WA_BUTTON_ATTRS]
+                )
+            except PlaywrightError as e:
+                logger.debug("Ошибка при поиске кнопок WhatsApp: %s", e)
+                buttons_attributes = []
+            
+            for attributes in buttons_attributes:
+                for attr, attr_value in attributes:
+                    # Отсутствующий атрибут - обычная ситуация
+                    if not attr_value:
+                        continue
+                    
+                    # Без "7", "wa.me" и "whatsapp" ни один паттерн не совпадет
+                    if '7' not in attr_value and 'wa.me' not in attr_value and 'whatsapp' not in attr_value:
+                        continue
+                    
+                    # Ищем номер телефона в атрибуте
+                    phone = _search_by_priority(_WA_ATTR_PHONE_RE, attr_value)
+                    if phone:
+                        result = f"https://wa.me/{_normalize_wa_phone(phone)}"
+                        logger.info("Создана ссылка WhatsApp из %s: %s", attr, result)
+                        return result
+                    
+                    # Ищем готовую ссылку WhatsApp
+                    if 'wa.me' in attr_value or 'whatsapp' in attr_value:
+                        wa_match = _WA_LINK_RE.search(attr_value)
+                        if wa_match:
+                            logger.info("Найдена ссылка WhatsApp в %s: %s", attr, wa_match.group(1))
+                            return wa_match.group(1)
 
-            # 3. Ищем в исходном коде страницы
+            # 3. Ищем в исходном коде страницы (HTML запрашивается, только если в нем есть что искать)
+            has_source_markers = None
             try:
-                page_content = await self.page.content()
-                
-                # Ищем ссылки 2gis с возможным WhatsApp
-                gis_patterns = [
-                    r'href=["\']([^"\']*link\.2gis\.com[^"\']*)["\']',
-                    r'(https://link\.2gis\.com/[^\s\'"]+)'
-                ]
+                has_source_markers = await self.page_html_matches(page, _WA_SOURCE_PROBE_RE)
+                if has_source_markers:
+                    page_content = await self.get_page_html(page)
+                else:
+                    page_content = ''
                 
-                for pattern in gis_patterns:
-                    matches = re.findall(pattern, page_content)
-                    for match in matches:
+                # Ищем ссылки 2gis с возможным WhatsApp, которых нет среди уже проверенных <a href>
+                # (дешевая проверка подстроки отсекает страницы без таких ссылок до регулярки)
+                if 'link.2gis.com' in page_content:
+                    # finditer вместо findall: HTML не сканируется дальше первой декодированной ссылки
+                    for gis_match in _GIS_LINK_RE.finditer(page_content):
+                        match = gis_match.group(1)
+                        if match in checked_gis_links:
+                            continue
+                        checked_gis_links.add(match)
                         decoded = await self.decode_2gis_link(match)
                         if decoded:
                             return decoded
                 
-                # Ищем номера телефонов в контексте WhatsApp
-                whatsapp_patterns = [
-                    r'whatsapp[^0-9]*(\+?7\d{10})',
-                    r'wa\.me/(\d+)',
-                    r'data-phone["\']:\s*["\'](\+?7\d{10})["\']',
-                    r'phone["\']:\s*["\'](\+?7\d{10})["\']',
-                    r'whatsapp["\']?\s*:\s*["\']([^"\']+)["\']'
-                ]
-                
-                for pattern in whatsapp_patterns:
-                    matches = re.findall(pattern, page_content, re.IGNORECASE)
-                    for match in matches:
-                        if 'wa.me' in match or 'whatsapp' in match:
-                            logger.info(f"Найдена ссылка WhatsApp в коде: {match}")
-                            return match
-                        elif re.match(r'\+?7?\d{10,11}', match):
-                            phone = match.replace('+', '').replace(' ', '').replace('-', '')
-                            if len(phone) == 11 and phone.startswith('7'):
-                                result = f"https://wa.me/{phone}"
-                            elif len(phone) == 10:
-                                result = f"https://wa.me/7{phone}"
-                            else:
-                                continue
-                            logger.info(f"Создана ссылка WhatsApp из паттерна: {result}")
-                            return result
+                # Ищем номера телефонов в контексте WhatsApp - все паттерны за один проход.
+                # Берется первый подходящий кандидат паттерна с наименьшим номером
+                best_index, best_result = None, None
+                if _WA_SOURCE_GATE_RE.search(page_content):
+                    for match in _WA_SOURCE_RE.finditer(page_content):
+                        index = int(match.lastgroup[1:])
+                        if best_index is not None and index >= best_index:
+                            continue
+                        result = self.whatsapp_from_source_match(
+                            match.group(_WA_SOURCE_RE.groupindex[match.lastgroup] + 1)
+                        )
+                        if result:
+                            best_index, best_result = index, result
+                            if index == 0:
+                                break
+                if best_result:
+                    logger.info("Найдена ссылка WhatsApp в коде: %s", best_result)
+                    return best_result
             except Exception as e:
-                logger.debug(f"Ошибка при поиске в исходном коде: {e}")
+                logger.debug("Ошибка при поиске в исходном коде: %s", e)
 
             # 4. Последняя попытка - ищем любые упоминания номеров рядом с WhatsApp в тексте
             try:
-                page_text = await self.page.text_content('body')
+                # Текст body берем из снимка карточки, если он уже есть, иначе - из полученного
+                # на шаге 3 HTML. Если в HTML нет даже слова "whatsapp", искать в тексте нечего
+                if page_text is None:
+                    html = self._page_html_cache.get(page)
+                    if html is not None:
+                        # Теги вырезаются, только если слово есть в HTML (иначе его нет и в тексте)
+                        if _WHATSAPP_WORD_RE.search(html):
+                            page_text = _HTML_TAG_RE.sub(' ', html)
+                    elif has_source_markers is None:
+                        page_text = await page.text_content('body')
                 if page_text:
-                    # Разбиваем текст по упоминаниям WhatsApp
-                    text_lower = page_text.lower()
-                    whatsapp_pos = text_lower.find('whatsapp')
+                    # Ищем первое упоминание WhatsApp без копии текста в нижнем регистре
+                    whatsapp_match = _WHATSAPP_WORD_RE.search(page_text)
                     
-                    if whatsapp_pos != -1:
+                    if whatsapp_match:
                         # Берем текст в радиусе 200 символов от слова WhatsApp
+                        whatsapp_pos = whatsapp_match.start()
                         start = max(0, whatsapp_pos - 100)
                         end = min(len(page_text), whatsapp_pos + 100)
-                        context = page_text[start:end]
                         
-                        # Ищем номер телефона в этом контексте
-                        phone_match = re.search(r'(\+?7\d{10})', context)
+                        # Ищем номер телефона в этом окне (без среза строки)
+                        phone_match = _KZ_PHONE_RE.search(page_text, start, end)
                         if phone_match:
-                            phone = phone_match.group(1).replace('+', '')
-                            if not phone.startswith('7'):
-                                phone = '7' + phone
-                            result = f"https://wa.me/{phone}"
-                            logger.info(f"Создана ссылка WhatsApp из контекста: {result}")
+                            result = f"https://wa.me/{_normalize_wa_phone(phone_match.group(1))}"
+                            logger.info("Создана ссылка WhatsApp из контекста: %s", result)
                             return result
             except Exception as e:
-                logger.debug(f"Ошибка при поиске в тексте: {e}")
+                logger.debug("Ошибка при поиске в тексте: %s", e)
                 
         except Exception as e:
-            logger.error(f"Критическая ошибка при поиске WhatsApp: {e}")
+            logger.error("Критическая ошибка при поиске WhatsApp: %s", e)
             
         return None
         
-    async def extract_instagram(self) -> Optional[str]:
-        """Извлечение Instagram - только реальные ссылки"""
+    def whatsapp_from_source_match(self, match: str) -> Optional[str]:
+        """Ссылка WhatsApp из найденного в исходном коде значения (None - если не подходит)"""
+        if 'wa.me' in match or 'whatsapp' in match:
+            return match
+        if _PHONE_LIKE_RE.match(match):
+            phone = _normalize_wa_phone(match)
+            if len(phone) == 11 and phone.startswith('7'):
+                return f"https://wa.me/{phone}"
+        return None
+        
+    def instagram_from_source_match(self, match: str) -> Optional[str]:
+        """Ссылка Instagram из найденного в исходном коде значения (None - если не подходит)"""
+        if match and 'instagram' not in match:
+            # Если найден только username, создаем полную ссылку
+            match = f"https://instagram.com/{match}"
+        elif match and not match.startswith('http'):
+            match = f"https://{match}"
+        if match and 'instagram.com' in match:
+            return match
+        return None
+        
+    async def extract_instagram(self, page: Page, page_text: Optional[str] = None) -> Optional[str]:
+        """Извлечение Instagram - только реальные ссылки
+        
+        page_text - текст страницы из снимка: прямые ссылки в нем уже проверены, а кнопки
+        с текстом "instagram" ищутся в браузере, только если это слово есть в тексте.
+        """
         try:
-            # Сначала ищем прямые ссылки на Instagram
-            instagram_links = await self.page.query_selector_all('a[href*="instagram"]')
-            for link in instagram_links:
-                href = await link.get_attribute('href')
-                if href and 'instagram' in href:
-                    logger.info(f"Найдена ссылка Instagram: {href}")
-                    return href
-                    
-            # Ищем кнопки Instagram и проверяем события
-            instagram_buttons = await self.page.query_selector_all('button, div, span, a')
-            for button in instagram_buttons:
-                try:
-                    text = await button.text_content()
-                    if text and 'instagram' in text.lower():
-                        # Проверяем onclick
-                        onclick = await button.get_attribute('onclick')
-                        if onclick:
-                            # Ищем ссылку в onclick
-                            instagram_match = re.search(r'(https://[^\'"\s]*instagram\.com[^\'"\s]*)', onclick)
-                            if instagram_match:
-                                link = instagram_match.group(1)
-                                logger.info(f"Найдена ссылка Instagram в onclick: {link}")
-                                return link
-                        
-                        # Проверяем data-атрибуты
-                        for attr in ['data-url', 'data-link', 'data-href', 'data-instagram', 'data-action']:
-                            attr_value = await button.get_attribute(attr)
-                            if attr_value and 'instagram' in attr_value:
-                                logger.info(f"Найдена ссылка Instagram в {attr}: {attr_value}")
-                                return attr_value
+            # Сначала ищем прямые ссылки на Instagram (без снимка страницы)
+            if page_text is None:
+                instagram_links = await page.query_selector_all('a[href*="instagram"]')
+                for link in instagram_links:
+                    href = await link.get_attribute('href')
+                    if href and 'instagram' in href:
+                        logger.info("Найдена ссылка Instagram: %s", href)
+                        return href
                         
-                        # Ищем родительские элементы с ссылками
-                        parent = button
-                        for _ in range(3):  # Проверяем до 3 уровней вверх
-                            try:
-                                parent = await parent.query_selector('xpath=..')
-                                if parent:
-                                    parent_href = await parent.get_attribute('href')
-                                    if parent_href and 'instagram' in parent_href:
-                                        logger.info(f"Найдена ссылка Instagram в родительском элементе: {parent_href}")
-                                        return parent_href
-                            except:
-                                break
-                except:
-                    continue
+            # Ищем кнопки Instagram и проверяем события - отбор по тексту делается в браузере
+            if page_text is None or _INSTAGRAM_WORD_RE.search(page_text):
+                instagram_buttons = await page.evaluate(_INSTAGRAM_ELEMENTS_JS, _INSTAGRAM_DATA_ATTRS)
+            else:
+                instagram_buttons = []
+            for button in instagram_buttons:
+                # Проверяем onclick
+                onclick = button['onclick']
+                if onclick:
+                    # Ищем ссылку в onclick
+                    instagram_match = _INSTAGRAM_ONCLICK_RE.search(onclick)
+                    if instagram_match:
+                        link = instagram_match.group(1)
+                        logger.info("Найдена ссылка Instagram в onclick: %s", link)
+                        return link
+                
+                # Проверяем data-атрибуты
+                for attr, attr_value in button['data']:
+                    if attr_value and 'instagram' in attr_value:
+                        logger.info("Найдена ссылка Instagram в %s: %s", attr, attr_value)
+                        return attr_value
+                
+                # Ищем родительские элементы с ссылками (до 3 уровней вверх)
+                for parent_href in button['parentHrefs']:
+                    if parent_href and 'instagram' in parent_href:
+                        logger.info("Найдена ссылка Instagram в родительском элементе: %s", parent_href)
+                        return parent_href
                     
             # Ищем в исходном коде страницы
             try:
-                page_content = await self.page.content()
-                # Ищем паттерны с Instagram ссылками
-                js_patterns = [
-                    r'instagram["\']?\s*:\s*["\']([^"\']+)["\']',
-                    r'instagram\.com/([^"\')\s/]+)',
-                    r'https://(?:www\.)?instagram\.com/([^"\')\s/]+)',
-                    r'window\.open\(["\']([^"\']*instagram[^"\']*)["\']',
-                    r'href\s*=\s*["\']([^"\']*instagram[^"\']*)["\']'
-                ]
-                
-                for pattern in js_patterns:
-                    matches = re.findall(pattern, page_content, re.IGNORECASE)
-                    for match in matches:
-                        if match and 'instagram' not in match:
-                            # Если найден только username, создаем полную ссылку
-                            match = f"https://instagram.com/{match}"
-                        elif match and 'instagram' in match and not match.startswith('http'):
-                            match = f"https://{match}"
-                        
-                        if match and 'instagram.com' in match:
-                            logger.info(f"Найдена ссылка Instagram в исходном коде: {match}")
-                            return match
-            except:
-                pass
+                # Все паттерны содержат "instagram" - без этого слова в коде искать нечего
+                if not await self.page_html_matches(page, _INSTAGRAM_WORD_RE):
+                    return None
+                page_content = await self.get_page_html(page)
+                # Все паттерны за один проход: берется первая подходящая ссылка паттерна с наименьшим номером
+                best_index, best_result = None, None
+                for match in _INSTAGRAM_SOURCE_RE.finditer(page_content):
+                    index = int(match.lastgroup[1:])
+                    if best_index is not None and index >= best_index:
+                        continue
+                    result = self.instagram_from_source_match(
+                        match.group(_INSTAGRAM_SOURCE_RE.groupindex[match.lastgroup] + 1)
+                    )
+                    if result:
+                        best_index, best_result = index, result
+                        if index == 0:
+                            break
+                if best_result:
+                    logger.info("Найдена ссылка Instagram в исходном коде: %s", best_result)
+                    return best_result
+            except PlaywrightError as e:
+                logger.debug("Ошибка при поиске Instagram в исходном коде: %s", e)
                 
         except Exception as e:
-            logger.error(f"Ошибка при поиске Instagram: {e}")
+            logger.error("Ошибка при поиске Instagram: %s", e)
             
         return None
         
     async def save_to_excel(self, filename: str):
         """Сохранение результатов в Excel с информацией о дедупликации"""
         try:
-            if not self.results:
+            if not self._result_count:
                 logger.warning("Нет данных для сохранения")
-                return
+                if self.results_workbook is None:
+                    return
                 
-            df = pd.DataFrame(self.results)
+            # Статистика дедупликации
+            stats = self.get_deduplication_stats()
+            stats_rows = [
+                ('Всего уникальных компаний', stats['unique_companies']),
+                ('Всего записей в результате', stats['total_records']),
+                ('Пропущено дубликатов', stats['duplicates_skipped']),
+                ('Категорий обработано', stats['categories_processed']),
+                ('Компаний с сайтами', stats['companies_with_websites']),
+                ('Компаний с WhatsApp', stats['companies_with_whatsapp']),
+                ('Компаний с Instagram', stats['companies_with_instagram'])
+            ]
             
-            with pd.ExcelWriter(filename, engine='openpyxl') as writer:
-                # Основные данные
-                df.to_excel(writer, sheet_name='Организации', index=False)
+            if self.results_workbook is None and xlsxwriter:
+                # Результаты накоплены в памяти по колонкам - строки собираются zip без словаря на строку
+                self.open_results_stream(filename)
+                for row in zip(*self.results.values()):
+                    self.write_result_values(row)
+                    
+            if self.results_workbook is not None:
+                self.close_results_stream(stats_rows)
+            else:
+                # Ширина колонок считается по каждой колонке (с учетом заголовков)
+                max_lengths = [
+                    max(len(column), max(map(len, map(str, values)), default=0))
+                    for column, values in self.results.items()
+                ]
                 
-                # Статистика дедупликации
-                stats_data = {
-                    'Метрика': [
-                        'Всего уникальных компаний',
-                        'Всего записей в результате',
-                        'Пропущено дубликатов',
-                        'Категорий обработано',
-                        'Компаний с сайтами',
-                        'Компаний с WhatsApp',
-                        'Компаний с Instagram'
-                    ],
-                    'Значение': [
-                        len(self.processed_companies),
-                        len(self.results),
-                        max(0, len(self.processed_companies) - len(self.results)),
-                        len(set(result['Категория'] for result in self.results)),
-                        len([r for r in self.results if r['Есть сайт'] == 'Да']),
-                        len([r for r in self.results if r['WhatsApp'] != 'Не указано']),
-                        len([r for r in self.results if r['Instagram'] != 'Не указано'])
-                    ]
-                }
-                stats_df = pd.DataFrame(stats_data)
-                stats_df.to_excel(writer, sheet_name='Статистика', index=False)
+                # Результаты уже хранятся по колонкам - DataFrame строится без транспонирования строк
+                df = pd.DataFrame(self.results, columns=RESULT_COLUMNS)
+                stats_df = pd.DataFrame(stats_rows, columns=['Метрика', 'Значение'])
                 
-                # Форматирование
-                worksheet = writer.sheets['Организации']
-                for column in worksheet.columns:
-                    max_length = 0
-                    column_letter = column[0].column_letter
-                    for cell in column:
-                        try:
-                            if len(str(cell.value)) > max_length:
-                                max_length = len(str(cell.value))
-                        except:
-                            pass
-                    adjusted_width = min(max_length + 2, 50)
-                    worksheet.column_dimensions[column_letter].width = adjusted_width
+                with pd.ExcelWriter(filename, engine='openpyxl') as writer:
+                    df.to_excel(writer, sheet_name='Организации', index=False)
+                    stats_df.to_excel(writer, sheet_name='Статистика', index=False)
+                    
+                    # Форматирование: буква колонки вычисляется по номеру, без обращения к ячейкам листа
+                    from openpyxl.utils import get_column_letter
+                    worksheet = writer.sheets['Организации']
+                    for i, length in enumerate(max_lengths, 1):
+                        worksheet.column_dimensions[get_column_letter(i)].width = min(length + 2, 50)
                     
-            logger.info(f"📊 Данные сохранены в файл: {filename}")
-            logger.info(f"📈 Всего записей: {len(self.results)}")
-            logger.info(f"🔄 Уникальных компаний: {len(self.processed_companies)}")
-            logger.info(f"⏭️ Пропущено дубликатов: {max(0, len(self.processed_companies) - len(self.results))}")
+            logger.info("📊 Данные сохранены в файл: %s", filename)
+            logger.info("📈 Всего записей: %s", stats['total_records'])
+            logger.info("🔄 Уникальных компаний: %s", stats['unique_companies'])
+            logger.info("⏭️ Пропущено дубликатов: %s", stats['duplicates_skipped'])
             
         except Exception as e:
-            logger.error(f"Ошибка при сохранении в Excel: {e}")
+            logger.error("Ошибка при сохранении в Excel: %s", e)
 
+    def open_results_stream(self, filename: str):
+        """Открытие Excel для потоковой записи: строки сбрасываются на диск по мере парсинга"""
+        # Ссылки пишутся обычными строками, как и через pandas/openpyxl: гиперссылки xlsxwriter
+        # хранит в памяти до закрытия файла, и их число на листе ограничено (65 530)
+        self.results_workbook = xlsxwriter.Workbook(
+            filename, {'constant_memory': True, 'strings_to_urls': False}
+        )
+        self._header_format = self.results_workbook.add_format({'bold': True, 'border': 1})
+        
+        # Основные данные - строго построчно, как требует режим constant_memory
+        self.results_sheet = self.results_workbook.add_worksheet('Организации')
+        self.results_sheet.write_row(0, 0, RESULT_COLUMNS, self._header_format)
+        self._stream_row = 1
+        self._column_max_lengths = [len(column) for column in RESULT_COLUMNS]
+        
+    def write_result_row(self, result: Dict):
+        """Запись строки результата в открытый Excel с учетом ширины колонок"""
+        self.write_result_values([result.get(column) for column in RESULT_COLUMNS])
+        
+    def write_result_values(self, row):
+        """Запись значений строки (в порядке RESULT_COLUMNS) в открытый Excel"""
+        self.results_sheet.write_row(self._stream_row, 0, row)
+        self._stream_row += 1
+        for i, value in enumerate(row):
+            value_length = len(str(value))
+            if value_length > self._column_max_lengths[i]:
+                self._column_max_lengths[i] = value_length
+                
+    def close_results_stream(self, stats_rows: List):
+        """Завершение потокового Excel: ширина колонок, лист статистики и закрытие файла"""
+        workbook, self.results_workbook = self.results_workbook, None
+        try:
+            for i, length in enumerate(self._column_max_lengths):
+                self.results_sheet.set_column(i, i, min(length + 2, 50))
+                
+            # Статистика дедупликации
+            stats_sheet = workbook.add_worksheet('Статистика')
+            stats_sheet.write_row(0, 0, ['Метрика', 'Значение'], self._header_format)
+            for row_index, row in enumerate(stats_rows, start=1):
+                stats_sheet.write_row(row_index, 0, row)
+        finally:
+            workbook.close()
+
+    def open_parquet_stream(self, filename: str):
+        """Открытие Parquet для пакетной записи результатов"""
+        schema = pa.schema([(column, pa.string()) for column in RESULT_COLUMNS])
+        self.parquet_writer = pq.ParquetWriter(filename, schema)
+        # Пакеты пишет отдельная задача в потоке - запись на диск не останавливает парсинг
+        self._parquet_queue = asyncio.Queue()
+        self._parquet_task = asyncio.create_task(self.drain_parquet_batches(self.parquet_writer))
+        
+    async def drain_parquet_batches(self, writer):
+        """Фоновая запись пакетов из очереди в Parquet (None в очереди - конец записи)"""
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = await self._parquet_queue.get()
+            if batch is None:
+                return
+            try:
+                await loop.run_in_executor(None, writer.write_batch, batch)
+            except Exception as e:
+                logger.error("Ошибка при записи пакета в Parquet: %s", e)
+        
+    def flush_parquet_batch(self):
+        """Передача накопленных по колонкам строк одним пакетом на запись"""
+        if self.parquet_writer is None or not self._parquet_columns[RESULT_COLUMNS[0]]:
+            return
+        batch = pa.record_batch(
+            [pa.array(values, type=pa.string()) for values in self._parquet_columns.values()],
+            names=RESULT_COLUMNS
+        )
+        self._parquet_queue.put_nowait(batch)
+        for values in self._parquet_columns.values():
+            values.clear()
+            
+    async def close_parquet_stream(self):
+        """Запись остатка буфера, ожидание фоновой записи и закрытие Parquet"""
+        try:
+            self.flush_parquet_batch()
+            self._parquet_queue.put_nowait(None)
+            await self._parquet_task
+        finally:
+            writer, self.parquet_writer = self.parquet_writer, None
+            writer.close()
+
+    def add_result(self, result: Dict):
+        """Добавление строки результата с обновлением счетчиков статистики"""
+        # При потоковой записи строка сразу уходит в файл и в памяти не хранится
+        if self.results_workbook is not None:
+            self.write_result_row(result)
+        else:
+            for column, values in self.results.items():
+                values.append(result.get(column))
+        if self.parquet_writer is not None:
+            for column, values in self._parquet_columns.items():
+                value = result.get(column)
+                values.append(None if value is None else str(value))
+            if len(self._parquet_columns[RESULT_COLUMNS[0]]) >= _PARQUET_BATCH_SIZE:
+                self.flush_parquet_batch()
+        self._result_count += 1
+        self._results_with_website += result['Есть сайт'] == 'Да'
+        self._results_with_whatsapp += result['WhatsApp'] != 'Не указано'
+        self._results_with_instagram += result['Instagram'] != 'Не указано'
+        
     def get_deduplication_stats(self) -> Dict:
-        """Получение статистики дедупликации"""
+        """Получение статистики дедупликации (по счетчикам, обновляемым по ходу парсинга)"""
         return {
             'unique_companies': len(self.processed_companies),
-            'total_records': len(self.results),
-            'duplicates_skipped': max(0, len(self.processed_companies) - len(self.results)),
-            'categories_processed': len(set(result['Категория'] for result in self.results)),
-            'companies_with_websites': len([r for r in self.results if r['Есть сайт'] == 'Да']),
-            'companies_with_whatsapp': len([r for r in self.results if r['WhatsApp'] != 'Не указано']),
-            'companies_with_instagram': len([r for r in self.results if r['Instagram'] != 'Не указано'])
+            'total_records': self._result_count,
+            'duplicates_skipped': self._duplicates_skipped,
+            'categories_processed': self._categories_processed,
+            'companies_with_websites': self._results_with_website,
+            'companies_with_whatsapp': self._results_with_whatsapp,
+            'companies_with_instagram': self._results_with_instagram
         }
             
     async def parse_category(self, category: str):
         """Парсинг одной категории с дедупликацией"""
         try:
-            logger.info(f"🎯 Начинаем парсинг категории: {category}")
+            logger.info("🎯 Начинаем парсинг категории: %s", category)
             
-            # Выполняем поиск
-            if not await self.open_2gis_and_search(category):
-                return
-                
-            # Получаем ссылки на все организации
-            business_urls = await self.get_business_links_pagination_fixed()
+            # Поиск и пагинация идут на свободной странице поиска - категории не мешают друг другу
+            search_page = await self.search_page_pool.get()
+            try:
+                # Выполняем поиск
+                if not await self.open_2gis_and_search(category, search_page):
+                    return
+                    
+                # Получаем ссылки на все организации
+                business_urls = await self.get_business_links_pagination_fixed(search_page)
+            finally:
+                self.search_page_pool.put_nowait(search_page)
             
             if not business_urls:
-                logger.warning(f"❌ Не найдено организаций для категории '{category}'")
+                logger.warning("❌ Не найдено организаций для категории '%s'", category)
                 return
                 
-            logger.info(f"🔍 Будем обрабатывать {len(business_urls)} организаций")
+            total = len(business_urls)
+            logger.info("🔍 Будем обрабатывать %s организаций", total)
+            
+            # Обрабатываем организации параллельно на страницах из пула
+            collected = 0  # Собрано организаций в этой категории
+            in_flight = 0  # Организаций, загружаемых в браузере прямо сейчас
+            
+            async def fetch_business(i: int, url: str) -> Optional[Dict]:
+                nonlocal collected, in_flight
+                # Лимит категории уже набран - ничего не загружаем
+                if collected >= self.max_items_per_category:
+                    return None
+                    
+                # Карточка уже обработана (в другой категории или прошлом запуске) - страницу не загружаем
+                if self.is_firm_already_seen(url):
+                    logger.debug("⏭️ Карточка уже обработана: %s", url)
+                    self._duplicates_skipped += 1
+                    return None
+                    
+                # В режиме --api-key браузер нужен только если API не вернул данные
+                fields = await self.fetch_fields_from_api(url)
+                if fields:
+                    if collected + in_flight >= self.max_items_per_category:
+                        return None
+                    logger.info("📋 Организация %d/%d получена из API", i, total)
+                    business_info = self.build_business_result(fields, category)
+                else:
+                    page = await self.page_pool.get()
+                    try:
+                        # Пока ждали свободную страницу, лимит мог набраться (с учетом загружаемых)
+                        if collected + in_flight >= self.max_items_per_category:
+                            return None
+                        in_flight += 1
+                        try:
+                            logger.info("📋 Обрабатываем организацию %d/%d", i, total)
+                            business_info = await self.extract_business_info(url, category, page)
+                            await self.adaptive_delay()
+                        finally:
+                            in_flight -= 1
+                    except Exception as e:
+                        logger.error("❌ Ошибка при обработке организации %s: %s", i, e)
+                        return None
+                    finally:
+                        await self.release_page(page)
+                        
+                if business_info:
+                    collected += 1
+                    self.remember_firm(url)
+                return business_info
             
-            # Обрабатываем каждую организацию
             processed = 0
             skipped = 0
-            
-            for i, url in enumerate(business_urls, 1):
+            # Готовые результаты записываются сразу, но в порядке выдачи: результат ждет,
+            # пока не будут готовы все организации перед ним
+            finished: Dict[int, Optional[Dict]] = {}
+            next_index = 1
+            
+            async def process_business(i: int, url: str):
+                nonlocal processed, skipped, next_index
+                # Ошибка одной организации не должна отменять обработку остальных
                 try:
-                    logger.info(f"📋 Обрабатываем организацию {i}/{len(business_urls)}")
+                    finished[i] = await fetch_business(i, url)
+                except Exception as e:
+                    logger.error("❌ Ошибка при обработке организации %s: %s", i, e)
+                    finished[i] = None
                     
-                    business_info = await self.extract_business_info(url, category)
+                while next_index in finished:
+                    business_info = finished.pop(next_index)
+                    next_index += 1
                     if business_info:
-                        self.results.append(business_info)
+                        self.add_result(business_info)
                         processed += 1
-                        logger.info(f"✅ Добавлена информация о: {business_info['Название']}")
+                        logger.info("✅ Добавлена информация о: %s", business_info['Название'])
                     else:
                         skipped += 1
-                        logger.info(f"⏭️ Организация пропущена (дубликат или ошибка)")
-                    
-                    await self.random_delay(2, 4)
-                    
-                except Exception as e:
-                    logger.error(f"❌ Ошибка при обработке организации {i}: {e}")
-                    skipped += 1
-                    continue
-                    
-            logger.info(f"🎉 Завершен парсинг категории '{category}'")
-            logger.info(f"📊 Обработано: {processed}, Пропущено: {skipped}")
+            
+            await asyncio.gather(*(process_business(i, url) for i, url in enumerate(business_urls, 1)))
+            
+            self._categories_processed += 1
+            self.flush_parquet_batch()
+            logger.info("🎉 Завершен парсинг категории '%s'", category)
+            logger.info("📊 Обработано: %s, Пропущено: %s", processed, skipped)
             
         except Exception as e:
-            logger.error(f"💥 Ошибка при парсинге категории '{category}': {e}")
+            logger.error("💥 Ошибка при парсинге категории '%s': %s", category, e)
             
     async def run(self, categories: List[str]):
         """Основной метод запуска парсера с дедупликацией"""
+        # Имя файла результатов определяется в момент запуска - под ним же сохраняются частичные результаты
+        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+        filename = f"2gis_results_{self.city}_{timestamp}.xlsx"
+        results_saved = False
+        
+        # SIGTERM (например, docker stop) отменяет запуск так же, как Ctrl+C: задачи категорий и организаций
+        # отменяются, а блок finally закрывает файлы и браузер
+        loop = asyncio.get_running_loop()
         try:
-            logger.info(f"🚀 Запуск парсера для города: {self.city}")
-            logger.info(f"📝 Категории: {', '.join(categories)}")
-            logger.info(f"🎯 Максимум на категорию: {self.max_items_per_category}")
+            loop.add_signal_handler(signal.SIGTERM, asyncio.current_task().cancel)
+            sigterm_handled = True
+        except (NotImplementedError, RuntimeError):  # Windows не поддерживает обработчики сигналов в цикле событий
+            sigterm_handled = False
             
+        try:
+            logger.info("🚀 Запуск парсера для города: %s", self.city)
+            logger.info("📝 Категории: %s", ', '.join(categories))
+            logger.info("🎯 Максимум на категорию: %s", self.max_items_per_category)
+            
+            self.load_dedup_state()
+            if self.api_key:
+                if httpx is None:
+                    logger.warning("⚠️ Для --api-key нужен пакет httpx - используется только браузер")
+                else:
+                    # Один клиент на весь запуск: соединения с API переиспользуются (keep-alive)
+                    self.http_client = httpx.AsyncClient(
+                        timeout=10,
+                        limits=httpx.Limits(
+                            max_connections=MAX_PARALLEL_API_REQUESTS,
+                            max_keepalive_connections=MAX_PARALLEL_API_REQUESTS,
+                            keepalive_expiry=_API_KEEPALIVE_EXPIRY
+                        )
+                    )
+                    self.api_semaphore = asyncio.Semaphore(MAX_PARALLEL_API_REQUESTS)
             await self.setup_browser()
             
-            for i, category in enumerate(categories, 1):
-                logger.info(f"\n{'='*50}")
-                logger.info(f"📂 Категория {i}/{len(categories)}: {category}")
-                logger.info(f"{'='*50}")
+            # Файл результатов открывается заранее - строки пишутся в него по мере парсинга
+            if xlsxwriter:
+                self.open_results_stream(filename)
+            parquet_filename = None
+            if self.parquet:
+                if pa is None:
+                    logger.warning("⚠️ Для --parquet нужен пакет pyarrow - результаты сохраняются только в Excel")
+                else:
+                    parquet_filename = f"2gis_results_{self.city}_{timestamp}.parquet"
+                    self.open_parquet_stream(parquet_filename)
+            
+            # Категории обрабатываются параллельно: поиск ограничен пулом страниц поиска, организации - общим пулом страниц
+            async def process_category(i: int, category: str):
+                logger.info("\n%s", '='*50)
+                logger.info("📂 Категория %s/%s: %s", i, len(categories), category)
+                logger.info("%s", '='*50)
                 
                 await self.parse_category(category)
                 
                 # Показываем промежуточную статистику
                 stats = self.get_deduplication_stats()
-                logger.info(f"📊 Промежуточная статистика:")
-                logger.info(f"   • Уникальных компаний: {stats['unique_companies']}")
-                logger.info(f"   • Записей в результате: {stats['total_records']}")
-                logger.info(f"   • Пропущено дубликатов: {stats['duplicates_skipped']}")
+                logger.info(
+                    "📊 Промежуточная статистика (после '%s'):\n"
+                    "   • Уникальных компаний: %d\n"
+                    "   • Записей в результате: %d\n"
+                    "   • Пропущено дубликатов: %d",
+                    category, stats['unique_companies'], stats['total_records'], stats['duplicates_skipped']
+                )
                 
-                if i < len(categories):  # Пауза между категориями
-                    logger.info(f"⏳ Пауза перед следующей категорией...")
-                    await self.random_delay(5, 8)
+            await asyncio.gather(*(process_category(i, category) for i, category in enumerate(categories, 1)))
                 
             # Сохранение результатов
-            timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-            filename = f"2gis_results_{self.city}_{timestamp}.xlsx"
             await self.save_to_excel(filename)
+            results_saved = True
+            if self.parquet_writer is not None:
+                await self.close_parquet_stream()
             
             # Финальная статистика
             final_stats = self.get_deduplication_stats()
-            logger.info(f"\n🎯 ФИНАЛЬНАЯ СТАТИСТИКА:")
-            logger.info(f"{'='*40}")
-            logger.info(f"📈 Всего уникальных компаний: {final_stats['unique_companies']}")
-            logger.info(f"📋 Записей в результате: {final_stats['total_records']}")
-            logger.info(f"🔄 Пропущено дубликатов: {final_stats['duplicates_skipped']}")
-            logger.info(f"📂 Категорий обработано: {final_stats['categories_processed']}")
-            logger.info(f"🌐 Компаний с сайтами: {final_stats['companies_with_websites']}")
-            logger.info(f"📱 Компаний с WhatsApp: {final_stats['companies_with_whatsapp']}")
-            logger.info(f"📸 Компаний с Instagram: {final_stats['companies_with_instagram']}")
-            logger.info(f"💾 Файл сохранен: {filename}")
-            logger.info(f"{'='*40}")
+            # Одна запись лога на весь блок статистики
+            stats_lines = [
+                "\n🎯 ФИНАЛЬНАЯ СТАТИСТИКА:",
+                '=' * 40,
+                f"📈 Всего уникальных компаний: {final_stats['unique_companies']}",
+                f"📋 Записей в результате: {final_stats['total_records']}",
+                f"🔄 Пропущено дубликатов: {final_stats['duplicates_skipped']}",
+                f"📂 Категорий обработано: {final_stats['categories_processed']}",
+                f"🌐 Компаний с сайтами: {final_stats['companies_with_websites']}",
+                f"📱 Компаний с WhatsApp: {final_stats['companies_with_whatsapp']}",
+                f"📸 Компаний с Instagram: {final_stats['companies_with_instagram']}",
+                f"💾 Файл сохранен: {filename}"
+            ]
+            if parquet_filename:
+                stats_lines.append(f"💾 Parquet сохранен: {parquet_filename}")
+            stats_lines.append('=' * 40)
+            logger.info("%s", "\n".join(stats_lines))
             
         except Exception as e:
-            logger.error(f"💥 Критическая ошибка: {e}")
+            logger.error("💥 Критическая ошибка: %s", e)
             raise
             
         finally:
+            if sigterm_handled:
+                loop.remove_signal_handler(signal.SIGTERM)
+            self.save_dedup_state()
+            if self.results_workbook is not None:
+                # Запуск прервался - закрываем файл, чтобы уже записанные строки сохранились
+                try:
+                    self.close_results_stream([('Всего записей в результате', self._result_count)])
+                    logger.info("💾 Частичные результаты сохранены: %s", filename)
+                except Exception as e:
+                    logger.error("Ошибка при сохранении частичных результатов: %s", e)
+            elif self.results[RESULT_COLUMNS[0]] and not results_saved:
+                # Без xlsxwriter результаты копятся в памяти - сохраняем то, что успели собрать
+                await self.save_to_excel(filename)
+            if self.parquet_writer is not None:
+                try:
+                    await self.close_parquet_stream()
+                except Exception as e:
+                    logger.error("Ошибка при сохранении Parquet: %s", e)
+            if self.http_client:
+                try:
+                    await self.http_client.aclose()
+                except Exception:
+                    pass
+            if self.context:
+                try:
+                    await self.context.close()
+                except Exception:
+                    pass
             if self.browser:
                 try:
                     await self.browser.close()
                     logger.info("🔒 Браузер закрыт")
-                except:
+                except Exception:
                     pass
             if hasattr(self, 'playwright'):
                 try:
                     await self.playwright.stop()
-                except:
+                except Exception:
                     pass
 
-def main():
-    """Главная функция с улучшенной обработкой аргументов"""
+# Библиотеки, чьи отладочные логи не нужны даже в подробном режиме
+_NOISY_LOGGERS = ('playwright', 'websockets', 'urllib3', 'asyncio', 'httpx', 'httpcore')
+
+# Ключи config.json и их типы (имена совпадают с атрибутами аргументов командной строки)
+_CONFIG_SCHEMA = {
+    'city': str,
+    'categories': list,
+    'max_items': int,
+    'dedup_state': str,
+    'api_key': str,
+    'concurrency': int,
+    'category_concurrency': int,
+    'user_data_dir': str,
+    'cdp_endpoint': str
+}
+
+@functools.lru_cache(maxsize=1)
+def build_arg_parser() -> argparse.ArgumentParser:
+    """Парсер аргументов командной строки (строится один раз)"""
     parser = argparse.ArgumentParser(
         description='Улучшенный парсер 2ГИС с дедупликацией и исправленным извлечением сайтов',
         formatter_class=argparse.RawDescriptionHelpFormatter,
@@ -1425,6 +2291,11 @@ def main():
 Примеры использования:
   python improved_2gis_parser.py --city "Астана" --categories "кофейни" "салоны красоты" --max-items 50
   python improved_2gis_parser.py --config config.json
+  python improved_2gis_parser.py --config config.json --dedup-state dedup.bloom
+  python improved_2gis_parser.py --categories "кофейни" --api-key <ключ API 2ГИС>
+  python improved_2gis_parser.py --categories "кофейни" --concurrency 8
+  python improved_2gis_parser.py --categories "кофейни" --parquet
+  python improved_2gis_parser.py --categories "кофейни" --cdp-endpoint http://localhost:9222
   python improved_2gis_parser.py --categories "стоматологии" "фитнес-центры" "рестораны"
         """
     )
@@ -1438,27 +2309,65 @@ def main():
                        help='Максимальное количество организаций на категорию (по умолчанию: 100)')
     parser.add_argument('--config', '-cfg', 
                        help='Путь к JSON файлу с конфигурацией')
+    parser.add_argument('--dedup-state',
+                       help='Файл состояния дедупликации между запусками (нужен pybloom_live)')
+    parser.add_argument('--api-key',
+                       help='Ключ API каталога 2ГИС: карточки запрашиваются напрямую, без браузера (нужен httpx)')
+    parser.add_argument('--concurrency', type=int, default=MAX_PARALLEL_PAGES,
+                       help=f'Сколько организаций обрабатывать одновременно (по умолчанию: {MAX_PARALLEL_PAGES})')
+    parser.add_argument('--category-concurrency', type=int, default=MAX_PARALLEL_CATEGORIES,
+                       help=f'Сколько категорий обрабатывать одновременно (по умолчанию: {MAX_PARALLEL_CATEGORIES})')
+    parser.add_argument('--user-data-dir',
+                       help='Каталог профиля браузера, сохраняемого между запусками (по умолчанию: .profiles/2gis_<город>)')
+    parser.add_argument('--fresh-profile', action='store_true',
+                       help='Запускать браузер с чистым профилем, без сохранения cookies')
+    parser.add_argument('--headless', action='store_true',
+                       help='Запускать браузер без окна')
+    parser.add_argument('--cdp-endpoint',
+                       help='Подключиться к уже запущенному Chrome по CDP (например, http://localhost:9222) вместо запуска нового')
+    parser.add_argument('--parquet', action='store_true',
+                       help='Дополнительно сохранять результаты в Parquet пакетами (нужен pyarrow)')
+    parser.add_argument('--no-uvloop', action='store_true',
+                       help='Не использовать uvloop, даже если он установлен')
     parser.add_argument('--verbose', '-v', action='store_true',
                        help='Подробный вывод (DEBUG уровень логирования)')
     
-    args = parser.parse_args()
+    return parser
+
+def main():
+    """Главная функция с улучшенной обработкой аргументов"""
+    args = build_arg_parser().parse_args()
     
     # Настройка уровня логирования
     if args.verbose:
-        logging.getLogger().setLevel(logging.DEBUG)
+        # DEBUG только для логов парсера - отладочные сообщения зависимостей замедляют работу
+        logger.setLevel(logging.DEBUG)
+        for name in _NOISY_LOGGERS:
+            logging.getLogger(name).setLevel(logging.WARNING)
         logger.info("🔍 Включен подробный режим логирования")
     
     # Загрузка конфигурации из файла
     if args.config:
         try:
-            with open(args.config, 'r', encoding='utf-8') as f:
-                config = json.load(f)
-                args.city = config.get('city', args.city)
-                args.categories = config.get('categories', args.categories)
-                args.max_items = config.get('max_items', args.max_items)
-                logger.info(f"📄 Конфигурация загружена из {args.config}")
+            with open(args.config, 'rb') as f:
+                raw_config = f.read()
+            config = orjson.loads(raw_config) if orjson else json.loads(raw_config)
+            if not isinstance(config, dict):
+                raise ValueError("ожидается JSON-объект")
+                
+            # Проверяем типы известных ключей - остальные ключи (например, target_analysis) игнорируются
+            for key, expected_type in _CONFIG_SCHEMA.items():
+                if key not in config:
+                    continue
+                value = config[key]
+                if not isinstance(value, expected_type) or isinstance(value, bool):
+                    raise ValueError(f"ключ '{key}' должен иметь тип {expected_type.__name__}")
+                if key == 'categories' and not all(isinstance(c, str) for c in value):
+                    raise ValueError("ключ 'categories' должен быть списком строк")
+                setattr(args, key, value)
+            logger.info("📄 Конфигурация загружена из %s", args.config)
         except Exception as e:
-            logger.error(f"❌ Ошибка при загрузке конфигурации: {e}")
+            logger.error("❌ Ошибка при загрузке конфигурации: %s", e)
             return
     
     # Валидация аргументов
@@ -1466,27 +2375,49 @@ def main():
         logger.error("❌ Максимальное количество элементов должно быть больше 0")
         return
         
+    if args.concurrency <= 0 or args.category_concurrency <= 0:
+        logger.error("❌ Количество параллельных обработчиков должно быть больше 0")
+        return
+        
     if not args.categories:
         logger.error("❌ Необходимо указать хотя бы одну категорию")
         return
     
+    # Профиль браузера по умолчанию - свой для каждого города (при подключении по CDP профиль задает сам браузер)
+    if args.fresh_profile or args.cdp_endpoint:
+        args.user_data_dir = None
+    elif not args.user_data_dir:
+        args.user_data_dir = os.path.join('.profiles', f'2gis_{args.city}')
+    
     # Создание и запуск парсера
-    logger.info(f"🎯 Инициализация парсера...")
+    logger.info("🎯 Инициализация парсера...")
     parser_instance = GISParser(
         city=args.city, 
-        max_items_per_category=args.max_items
+        max_items_per_category=args.max_items,
+        dedup_state_file=args.dedup_state,
+        api_key=args.api_key,
+        concurrency=args.concurrency,
+        user_data_dir=args.user_data_dir,
+        category_concurrency=args.category_concurrency,
+        parquet=args.parquet,
+        headless=args.headless,
+        cdp_endpoint=args.cdp_endpoint
     )
     
     try:
-        logger.info(f"▶️ Запуск парсинга...")
+        logger.info("▶️ Запуск парсинга...")
+        # uvloop быстрее стандартного цикла событий; под Windows он не работает
+        if uvloop and not args.no_uvloop and sys.platform != 'win32':
+            asyncio.set_event_loop_policy(uvloop.EventLoopPolicy())
+            logger.debug("Используется цикл событий uvloop")
         asyncio.run(parser_instance.run(args.categories))
         logger.info("🎉 Парсинг завершен успешно!")
         
-    except KeyboardInterrupt:
+    except (KeyboardInterrupt, asyncio.CancelledError):
         logger.info("⏹️ Парсинг прерван пользователем")
         
     except Exception as e:
-        logger.error(f"💥 Парсинг завершен с ошибкой: {e}")
+        logger.error("💥 Парсинг завершен с ошибкой: %s", e)
         return 1
         
     return 0